@@ -1,33 +1,365 @@
+import atexit
 import os
 import sqlite3
-import traceback
-from datetime import datetime
+import threading
+import time
+from functools import wraps
 
-from flask import Flask, jsonify, request
+import orjson
+from flask import Flask, request, stream_with_context
+
+from calendar_schema import apply_shared_schema
 
 app = Flask(__name__)
 
 # Database configuration
 DB_PATH = "calendar_database.db"
+DB_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-64000",
+    "mmap_size=268435456",
+    "foreign_keys=ON",
+    "wal_autocheckpoint=1000",
+    "busy_timeout=30000",
+)
+# Seconds between background WAL truncations
+WAL_CHECKPOINT_INTERVAL = 3600
+
+# Supporting index for USERS name lookups. The attendee and name search
+# indexes are shared with the model, see calendar_schema. Planner statistics
+# are left to the PRAGMA optimize run at shutdown.
+SQL_CREATE_USERS_NAME_INDEX = "CREATE INDEX IF NOT EXISTS ix_users_name ON USERS (name)"
+
+# Request body fields for the event endpoints
+EVENT_REQUIRED_FIELDS = ("title", "start_time", "end_time")
+EVENT_UPDATE_FIELDS = ("title", "description", "start_time", "end_time")
+
+# Trigrams need at least three characters, shorter searches fall back to LIKE
+FTS_MIN_QUERY_LENGTH = 3
+
+# SQL statements, kept as module constants so the per-connection statement
+# cache reuses the prepared statements across requests
+
+# Organizer and participants of the event aliased as e, with the participants
+# already encoded as a JSON array by SQLite
+SQL_EVENT_PEOPLE_COLUMNS = """
+    (SELECT o.user_id FROM USER_EVENTS o
+     WHERE o.event_id = e.id AND o.is_organizer = 1
+     ORDER BY o.user_id LIMIT 1) AS organizer_id,
+    (SELECT json_group_array(json_object('id', p.id, 'username', p.name))
+     FROM (SELECT u.id, u.name FROM USER_EVENTS pe
+           JOIN USERS u ON u.id = pe.user_id
+           WHERE pe.event_id = e.id
+           ORDER BY u.id) p) AS participants_json
+"""
+SQL_GET_USERS = "SELECT id, name FROM USERS ORDER BY id"
+SQL_GET_USER = "SELECT id, name, email FROM USERS WHERE id = ?"
+SQL_GET_USER_EVENT_TITLES = """
+    SELECT e.id, e.title
+    FROM EVENTS e
+    JOIN USER_EVENTS ue ON e.id = ue.event_id
+    WHERE ue.user_id = ?
+"""
+SQL_INSERT_USER = "INSERT INTO USERS (name, email) VALUES (?, ?)"
+SQL_GET_USER_BY_NAME = "SELECT id, name, email FROM USERS WHERE name = ?"
+SQL_GET_USER_EVENTS = """
+    SELECT e.id, e.title, e.description, e.start_time, e.end_time
+    FROM EVENTS e
+    JOIN USER_EVENTS ue ON e.id = ue.event_id
+    WHERE ue.user_id = ?
+"""
+SQL_GET_USER_EVENTS_WITH_PEOPLE = f"""
+    SELECT e.id, e.title, e.description, e.start_time, e.end_time,
+           {SQL_EVENT_PEOPLE_COLUMNS}
+    FROM EVENTS e
+    JOIN USER_EVENTS ue ON e.id = ue.event_id
+    WHERE ue.user_id = ?
+"""
+SQL_GET_USER_ID_BY_NAME = "SELECT id FROM USERS WHERE name = ?"
+SQL_SEARCH_USERS = "SELECT id, name FROM USERS WHERE name LIKE ? ORDER BY id LIMIT 10"
+SQL_SEARCH_USERS_FTS = """
+    SELECT u.id, u.name
+    FROM users_fts
+    JOIN USERS u ON u.id = users_fts.rowid
+    WHERE users_fts MATCH ?
+    ORDER BY u.id
+    LIMIT 10
+"""
+SQL_GET_EVENTS = f"""
+    SELECT e.id, e.title, e.description, e.start_time, e.end_time,
+           {SQL_EVENT_PEOPLE_COLUMNS}
+    FROM EVENTS e
+"""
+SQL_INSERT_EVENT = """
+    INSERT INTO EVENTS (title, description, start_time, end_time, meeting_room_id)
+    VALUES (?, ?, ?, ?, ?)
+    RETURNING id, title, description, start_time, end_time
+"""
+SQL_INSERT_USER_EVENT = """
+    INSERT INTO USER_EVENTS (user_id, event_id, is_organizer)
+    VALUES (?, ?, ?)
+"""
+SQL_ADD_PARTICIPANT_IF_EXISTS = """
+    INSERT OR IGNORE INTO USER_EVENTS (user_id, event_id, is_organizer)
+    SELECT ?, ?, 0
+    WHERE EXISTS (SELECT 1 FROM EVENTS WHERE id = ?)
+    AND EXISTS (SELECT 1 FROM USERS WHERE id = ?)
+"""
+SQL_EVENT_AND_USER_EXIST = """
+    SELECT EXISTS (SELECT 1 FROM EVENTS WHERE id = ?),
+           EXISTS (SELECT 1 FROM USERS WHERE id = ?)
+"""
+SQL_FIND_UNKNOWN_USER = """
+    SELECT je.value FROM json_each(?) je
+    WHERE NOT EXISTS (SELECT 1 FROM USERS u WHERE u.id = je.value)
+    LIMIT 1
+"""
+SQL_MEETING_ROOM_EXISTS = "SELECT 1 FROM MEETING_ROOMS WHERE id = ?"
+SQL_DELETE_EVENT = "DELETE FROM EVENTS WHERE id = ?"
+SQL_GET_EVENT = """
+    SELECT id, title, description, start_time, end_time
+    FROM EVENTS
+    WHERE id = ?
+"""
+SQL_GET_EVENT_WITH_PEOPLE = f"""
+    SELECT e.id, e.title, e.description, e.start_time, e.end_time,
+           {SQL_EVENT_PEOPLE_COLUMNS}
+    FROM EVENTS e
+    WHERE e.id = ?
+"""
+SQL_GET_EVENT_PEOPLE = f"SELECT {SQL_EVENT_PEOPLE_COLUMNS} FROM EVENTS e WHERE e.id = ?"
+SQL_GET_ORGANIZER = """
+    SELECT user_id FROM USER_EVENTS
+    WHERE event_id = ? AND is_organizer = 1
+"""
+SQL_DELETE_UNINVITED = """
+    DELETE FROM USER_EVENTS
+    WHERE event_id = ? AND user_id IS NOT ?
+    AND (is_organizer = 1 OR user_id NOT IN (SELECT value FROM json_each(?)))
+"""
+SQL_ADD_PARTICIPANTS = """
+    INSERT OR IGNORE INTO USER_EVENTS (user_id, event_id, is_organizer)
+    SELECT je.value, ?, 0 FROM json_each(?) je
+    WHERE je.value IS NOT ?
+"""
+
+# Connections are opened once per thread and reused across requests
+_local = threading.local()
+_connections = []
+_indexes_ready = False
+_indexes_lock = threading.Lock()
+
+# Connection that only reads PRAGMA data_version, which changes whenever any
+# other connection, in this or another worker process, commits a write
+_version_conn = None
+_version_lock = threading.Lock()
+
+# Response cache for read endpoints: request path -> (expires_at, data_version,
+# body). Entries are only served while the database is unchanged, so a write
+# handled by one worker is seen by the next read on every worker
+CACHE = {}
+CACHE_LOCK = threading.Lock()
+CACHE_TTL = 30
+CACHE_MAX_ENTRIES = 1024
+# Autocomplete searches repeat the same query within seconds
+SEARCH_CACHE_TTL = 5
 
 
 # Helper function to get database connection
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        # Only the owning thread uses the connection, check_same_thread is off so
+        # close_connections can optimize and close it at exit
+        conn = sqlite3.connect(DB_PATH, cached_statements=256, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in DB_PRAGMAS:
+            conn.execute(f"PRAGMA {pragma}")
+        ensure_indexes(conn)
+        _local.conn = conn
+        with _indexes_lock:
+            _connections.append(conn)
     return conn
 
 
+# Roll back whatever a failed request left open, so the thread's connection
+# starts the next request outside a transaction
+@app.teardown_request
+def rollback_open_transaction(exc):
+    conn = getattr(_local, "conn", None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+
+# Helper function to create supporting indexes and start the WAL checkpoint
+# thread once per process. The DDL runs in one write transaction, so workers
+# starting together wait on the busy timeout for each other
+def ensure_indexes(conn):
+    global _indexes_ready
+    with _indexes_lock:
+        if not _indexes_ready:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(SQL_CREATE_USERS_NAME_INDEX)
+                apply_shared_schema(conn)
+            threading.Thread(target=checkpoint_wal, daemon=True).start()
+            _indexes_ready = True
+
+
+# Helper function to get the database's current data version. The schema is
+# set up first, so its own writes don't change the version afterwards
+def get_data_version():
+    global _version_conn
+    get_db_connection()
+    with _version_lock:
+        if _version_conn is None:
+            _version_conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+            with _indexes_lock:
+                _connections.append(_version_conn)
+        return _version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+# Periodically truncate the WAL file so readers stay on the main database file
+def checkpoint_wal():
+    conn = sqlite3.connect(DB_PATH)
+    while True:
+        time.sleep(WAL_CHECKPOINT_INTERVAL)
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error:
+            pass
+
+
+# Refresh planner statistics and close every connection on shutdown
+@atexit.register
+def close_connections():
+    with _indexes_lock:
+        connections = list(_connections)
+        _connections.clear()
+    for conn in connections:
+        try:
+            conn.execute("PRAGMA optimize")
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+# Helper function to build an event payload from the event columns followed by
+# SQL_EVENT_PEOPLE_COLUMNS. The participants JSON from SQLite is spliced in as is
+def event_payload(
+    event_id, title, description, start_time, end_time, organizer_id, participants
+):
+    return {
+        "id": event_id,
+        "title": title,
+        "description": description,
+        "start_time": start_time,
+        "end_time": end_time,
+        "user_id": organizer_id,
+        "participants": orjson.Fragment(participants),
+    }
+
+
+# Helper function to check that the users and meeting room an event refers to
+# exist. Returns an error response naming the first unknown id, or None
+def check_event_references(cursor, user_ids, meeting_room_id=None):
+    cursor.execute(SQL_FIND_UNKNOWN_USER, (orjson.dumps(user_ids).decode(),))
+    unknown_user = cursor.fetchone()
+    if unknown_user:
+        return json_response({"error": f"User {unknown_user[0]} not found"}, 400)
+
+    if meeting_room_id is not None:
+        cursor.execute(SQL_MEETING_ROOM_EXISTS, (meeting_room_id,))
+        if not cursor.fetchone():
+            return json_response(
+                {"error": f"Meeting room {meeting_room_id} not found"}, 400
+            )
+
+    return None
+
+
+# Helper function to decode the request body with orjson. Returns None unless
+# the body is a non-empty JSON object
+def get_json_body():
+    try:
+        data = orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) and data else None
+
+
+# Helper function to build a JSON response with orjson
+def json_response(obj, status=200):
+    return app.response_class(
+        orjson.dumps(obj), status=status, mimetype="application/json"
+    )
+
+
+# Cache-aside decorator for GET endpoints, keyed on the request path
+def cached(ttl=CACHE_TTL):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.full_path
+            now = time.monotonic()
+            version = get_data_version()
+            with CACHE_LOCK:
+                entry = CACHE.get(key)
+            if entry and entry[0] > now and entry[1] == version:
+                return app.response_class(entry[2], mimetype="application/json")
+
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                if response.is_streamed:
+                    response.response = cache_stream(
+                        key, now + ttl, version, response.response
+                    )
+                else:
+                    store_cached(key, now + ttl, version, response.get_data())
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def store_cached(key, expires_at, version, body):
+    with CACHE_LOCK:
+        if len(CACHE) >= CACHE_MAX_ENTRIES:
+            CACHE.clear()
+        CACHE[key] = (expires_at, version, body)
+
+
+# Pass a streamed body through, caching it only once it has been fully sent and
+# only if no write landed while the client was reading
+def cache_stream(key, expires_at, version, chunks):
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    if get_data_version() == version:
+        store_cached(key, expires_at, version, b"".join(parts))
+
+
+# Drop this worker's cached responses after a write. Other workers skip their
+# entries once they see the new data version
+def invalidate_cache():
+    with CACHE_LOCK:
+        CACHE.clear()
+
+
 # User endpoints
 @app.route("/api/users", methods=["GET"])
+@cached()
 def get_users():
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT id, name FROM USERS")
-    users = [{"id": row["id"], "username": row["name"]} for row in cursor.fetchall()]
-    conn.close()
+    cursor.execute(SQL_GET_USERS)
+    users = [{"id": uid, "username": name} for uid, name in cursor.fetchall()]
 
-    return jsonify(users)
+    return json_response(users)
 
 
 @app.route("/api/users/<user_id>", methods=["GET"])
@@ -36,35 +368,28 @@ def get_user(user_id):
     cursor = conn.cursor()
 
     # Get user details
-    cursor.execute("SELECT id, name, email FROM USERS WHERE id = ?", (user_id,))
+    cursor.execute(SQL_GET_USER, (user_id,))
     user = cursor.fetchone()
 
     if not user:
-        conn.close()
-        return jsonify({"error": "User not found"}), 404
+        return json_response({"error": "User not found"}, 404)
 
     # Get user's events
     cursor.execute(
-        """
-        SELECT e.id, e.title 
-        FROM EVENTS e
-        JOIN USER_EVENTS ue ON e.id = ue.event_id
-        WHERE ue.user_id = ?
-    """,
+        SQL_GET_USER_EVENT_TITLES,
         (user_id,),
     )
 
-    events = [{"id": row["id"], "title": row["title"]} for row in cursor.fetchall()]
-    conn.close()
+    events = [{"id": eid, "title": title} for eid, title in cursor.fetchall()]
 
-    return jsonify({"id": user["id"], "username": user["name"], "events": events})
+    return json_response({"id": user["id"], "username": user["name"], "events": events})
 
 
 @app.route("/api/users", methods=["POST"])
 def create_user():
-    data = request.json
+    data = get_json_body()
     if not data or not data.get("username"):
-        return jsonify({"error": "Username is required"}), 400
+        return json_response({"error": "Username is required"}, 400)
 
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -73,44 +398,39 @@ def create_user():
         # Get email from request or generate one
         email = data.get("email", f"{data['username']}@example.com")
 
-        cursor.execute(
-            "INSERT INTO USERS (name, email) VALUES (?, ?)", (data["username"], email)
-        )
+        cursor.execute(SQL_INSERT_USER, (data["username"], email))
 
         user_id = cursor.lastrowid
         conn.commit()
-        conn.close()
+        invalidate_cache()
 
-        return jsonify({"id": user_id, "username": data["username"]}), 201
+        return json_response({"id": user_id, "username": data["username"]}, 201)
     except sqlite3.IntegrityError:
-        conn.close()
-        return jsonify({"error": "Username already exists or email is taken"}), 400
+        conn.rollback()
+        return json_response(
+            {"error": "Username already exists or email is taken"}, 400
+        )
     except Exception as e:
-        conn.close()
-        return jsonify({"error": str(e)}), 500
+        conn.rollback()
+        return json_response({"error": str(e)}, 500)
 
 
 @app.route("/api/users/username/<username>", methods=["GET"])
+@cached()
 def get_user_by_username(username):
     conn = get_db_connection()
     cursor = conn.cursor()
 
     # Get user details
-    cursor.execute("SELECT id, name, email FROM USERS WHERE name = ?", (username,))
+    cursor.execute(SQL_GET_USER_BY_NAME, (username,))
     user = cursor.fetchone()
 
     if not user:
-        conn.close()
-        return jsonify({"error": f"User '{username}' not found"}), 404
+        return json_response({"error": f"User '{username}' not found"}, 404)
 
     # Get user's events
     cursor.execute(
-        """
-        SELECT e.id, e.title, e.description, e.start_time, e.end_time
-        FROM EVENTS e
-        JOIN USER_EVENTS ue ON e.id = ue.event_id
-        WHERE ue.user_id = ?
-    """,
+        SQL_GET_USER_EVENTS,
         (user["id"],),
     )
 
@@ -125,9 +445,7 @@ def get_user_by_username(username):
         for row in cursor.fetchall()
     ]
 
-    conn.close()
-
-    return jsonify({"id": user["id"], "username": user["name"], "events": events})
+    return json_response({"id": user["id"], "username": user["name"], "events": events})
 
 
 @app.route("/api/users/username/<username>/events", methods=["GET"])
@@ -136,165 +454,100 @@ def get_user_events_by_username(username):
     cursor = conn.cursor()
 
     # Get user ID
-    cursor.execute("SELECT id FROM USERS WHERE name = ?", (username,))
+    cursor.execute(SQL_GET_USER_ID_BY_NAME, (username,))
     user = cursor.fetchone()
 
     if not user:
-        conn.close()
-        return jsonify({"error": f"User '{username}' not found"}), 404
+        return json_response({"error": f"User '{username}' not found"}, 404)
 
-    # Get user's events
-    cursor.execute(
-        """
-        SELECT e.id, e.title, e.description, e.start_time, e.end_time
-        FROM EVENTS e
-        JOIN USER_EVENTS ue ON e.id = ue.event_id
-        WHERE ue.user_id = ?
-    """,
-        (user["id"],),
-    )
+    # Get user's events along with their organizers and participants
+    cursor.execute(SQL_GET_USER_EVENTS_WITH_PEOPLE, (user["id"],))
+    events = [event_payload(*event) for event in cursor.fetchall()]
 
-    events_data = cursor.fetchall()
-    events = []
-
-    for event in events_data:
-        # Get event organizer
-        cursor.execute(
-            """
-            SELECT user_id 
-            FROM USER_EVENTS 
-            WHERE event_id = ? AND is_organizer = 1
-        """,
-            (event["id"],),
-        )
-        organizer = cursor.fetchone()
-        organizer_id = organizer["user_id"] if organizer else None
-
-        # Get participants
-        cursor.execute(
-            """
-            SELECT u.id, u.name
-            FROM USERS u
-            JOIN USER_EVENTS ue ON u.id = ue.user_id
-            WHERE ue.event_id = ?
-        """,
-            (event["id"],),
-        )
-
-        participants = [
-            {"id": row["id"], "username": row["name"]} for row in cursor.fetchall()
-        ]
-
-        events.append(
-            {
-                "id": event["id"],
-                "title": event["title"],
-                "description": event["description"],
-                "start_time": event["start_time"],
-                "end_time": event["end_time"],
-                "user_id": organizer_id,
-                "participants": participants,
-            }
-        )
-
-    conn.close()
-    return jsonify(events)
+    return json_response(events)
 
 
 @app.route("/api/users/search", methods=["GET"])
+@cached(ttl=SEARCH_CACHE_TTL)
 def search_users():
     query = request.args.get("q", "")
     if not query or len(query) < 2:
-        return jsonify([]), 200
+        return json_response([], 200)
 
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute(
-        "SELECT id, name FROM USERS WHERE name LIKE ? LIMIT 10", (f"%{query}%",)
-    )
-    users = [{"id": row["id"], "username": row["name"]} for row in cursor.fetchall()]
-    conn.close()
+    if len(query) >= FTS_MIN_QUERY_LENGTH:
+        # Quote the query so it is matched as a literal substring
+        phrase = '"' + query.replace('"', '""') + '"'
+        cursor.execute(SQL_SEARCH_USERS_FTS, (phrase,))
+    else:
+        cursor.execute(SQL_SEARCH_USERS, (f"%{query}%",))
+    users = [{"id": uid, "username": name} for uid, name in cursor.fetchall()]
 
-    return jsonify(users)
+    return json_response(users)
 
 
 # Event endpoints
 @app.route("/api/events", methods=["GET"])
+@cached()
 def get_events():
     conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT id, title, description, start_time, end_time FROM EVENTS")
-    events_data = cursor.fetchall()
-    result = []
-
-    for event in events_data:
-        # Get organizer
-        cursor.execute(
-            """
-            SELECT user_id 
-            FROM USER_EVENTS 
-            WHERE event_id = ? AND is_organizer = 1
-        """,
-            (event["id"],),
-        )
-        organizer = cursor.fetchone()
-        organizer_id = organizer["user_id"] if organizer else None
-
-        # Get participants
-        cursor.execute(
-            """
-            SELECT u.id, u.name
-            FROM USERS u
-            JOIN USER_EVENTS ue ON u.id = ue.user_id
-            WHERE ue.event_id = ?
-        """,
-            (event["id"],),
-        )
-
-        participants = [
-            {"id": row["id"], "username": row["name"]} for row in cursor.fetchall()
-        ]
-
-        result.append(
-            {
-                "id": event["id"],
-                "title": event["title"],
-                "description": event["description"],
-                "start_time": event["start_time"],
-                "end_time": event["end_time"],
-                "user_id": organizer_id,
-                "participants": participants,
-            }
-        )
 
-    conn.close()
-    return jsonify(result)
+    # Stream the array one event at a time instead of building it in memory
+    def generate():
+        yield b"["
+        separator = b""
+        for event in conn.execute(SQL_GET_EVENTS):
+            yield separator + orjson.dumps(event_payload(*event))
+            separator = b","
+        yield b"]"
+
+    return app.response_class(
+        stream_with_context(generate()), mimetype="application/json"
+    )
 
 
 @app.route("/api/events", methods=["POST"])
 def create_event():
-    data = request.json
+    data = get_json_body()
     if not data:
-        return jsonify({"error": "No data provided"}), 400
+        return json_response({"error": "No data provided"}, 400)
 
     # Validate required fields
-    required_fields = ["title", "start_time", "end_time"]
-    for field in required_fields:
-        if field not in data:
-            return jsonify({"error": f"Missing required field: {field}"}), 400
+    missing = next((f for f in EVENT_REQUIRED_FIELDS if f not in data), None)
+    if missing:
+        return json_response({"error": f"Missing required field: {missing}"}, 400)
 
     conn = get_db_connection()
     cursor = conn.cursor()
 
+    # Organizer and participants as (user_id, is_organizer)
+    attendees = []
+    if data.get("user_id"):
+        attendees.append((data["user_id"], 1))
+
+    if data.get("invited_users") and isinstance(data["invited_users"], list):
+        attendees.extend(
+            (user_id, 0)
+            for user_id in data["invited_users"]
+            if user_id != data.get("user_id")  # Skip organizer
+        )
+
     try:
+        conn.execute("BEGIN")
+
+        # Reject unknown users or rooms before the foreign keys do
+        error = check_event_references(
+            cursor, [user_id for user_id, _ in attendees], data.get("meeting_room_id")
+        )
+        if error:
+            conn.rollback()
+            return error
+
         # Create event
         cursor.execute(
-            """
-            INSERT INTO EVENTS (title, description, start_time, end_time, meeting_room_id) 
-            VALUES (?, ?, ?, ?, ?)
-        """,
+            SQL_INSERT_EVENT,
             (
                 data["title"],
                 data.get("description", ""),
@@ -304,128 +557,69 @@ def create_event():
             ),
         )
 
-        event_id = cursor.lastrowid
+        event = cursor.fetchone()
+        event_id = event["id"]
 
-        # Add organizer
-        if data.get("user_id"):
-            cursor.execute(
-                """
-                INSERT INTO USER_EVENTS (user_id, event_id, is_organizer) 
-                VALUES (?, ?, 1)
-            """,
-                (data["user_id"], event_id),
-            )
+        # Add organizer and participants in a single batch
+        cursor.executemany(
+            SQL_INSERT_USER_EVENT,
+            [(user_id, event_id, is_organizer) for user_id, is_organizer in attendees],
+        )
 
-        # Add participants
-        if data.get("invited_users") and isinstance(data["invited_users"], list):
-            for user_id in data["invited_users"]:
-                if user_id != data.get("user_id"):  # Skip organizer
-                    cursor.execute(
-                        """
-                        INSERT INTO USER_EVENTS (user_id, event_id, is_organizer) 
-                        VALUES (?, ?, 0)
-                    """,
-                        (user_id, event_id),
-                    )
+        # Get participants as encoded by SQLite
+        cursor.execute(SQL_GET_EVENT_PEOPLE, (event_id,))
+        participants = cursor.fetchone()["participants_json"]
 
         conn.commit()
+        invalidate_cache()
 
-        # Get the created event
-        cursor.execute(
-            """
-            SELECT id, title, description, start_time, end_time
-            FROM EVENTS WHERE id = ?
-        """,
-            (event_id,),
-        )
-        event = cursor.fetchone()
-
-        # Get participants
-        cursor.execute(
-            """
-            SELECT u.id, u.name
-            FROM USERS u
-            JOIN USER_EVENTS ue ON u.id = ue.user_id
-            WHERE ue.event_id = ?
-        """,
-            (event_id,),
-        )
-
-        participants = [
-            {"id": row["id"], "username": row["name"]} for row in cursor.fetchall()
-        ]
-
-        conn.close()
-
-        return (
-            jsonify(
-                {
-                    "id": event["id"],
-                    "title": event["title"],
-                    "description": event["description"],
-                    "start_time": event["start_time"],
-                    "end_time": event["end_time"],
-                    "user_id": data.get("user_id"),
-                    "participants": participants,
-                }
-            ),
+        return json_response(
+            event_payload(*event, data.get("user_id"), participants),
             201,
         )
+    except sqlite3.IntegrityError as e:
+        conn.rollback()
+        return json_response({"error": str(e)}, 400)
     except Exception as e:
         conn.rollback()
-        conn.close()
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
 
 
 @app.route("/api/events/<event_id>/users", methods=["POST"])
 def add_user_to_event(event_id):
-    data = request.json
+    data = get_json_body()
     if not data or not data.get("user_id"):
-        return jsonify({"error": "User ID is required"}), 400
+        return json_response({"error": "User ID is required"}, 400)
 
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    # Check if event exists
-    cursor.execute("SELECT id FROM EVENTS WHERE id = ?", (event_id,))
-    event = cursor.fetchone()
-    if not event:
-        conn.close()
-        return jsonify({"error": "Event not found"}), 404
-
-    # Check if user exists
-    cursor.execute("SELECT id FROM USERS WHERE id = ?", (data["user_id"],))
-    user = cursor.fetchone()
-    if not user:
-        conn.close()
-        return jsonify({"error": "User not found"}), 404
-
-    # Check if user is already in event
-    cursor.execute(
-        """
-        SELECT 1 FROM USER_EVENTS
-        WHERE event_id = ? AND user_id = ?
-    """,
-        (event_id, data["user_id"]),
-    )
+    try:
+        # Add the user only if both the event and the user exist
+        cursor.execute(
+            SQL_ADD_PARTICIPANT_IF_EXISTS,
+            (data["user_id"], event_id, event_id, data["user_id"]),
+        )
 
-    if cursor.fetchone():
-        conn.close()
-        return jsonify({"success": True}), 200
+        if cursor.rowcount == 0:
+            conn.rollback()
 
-    # Add user to event
-    cursor.execute(
-        """
-        INSERT INTO USER_EVENTS (user_id, event_id, is_organizer)
-        VALUES (?, ?, 0)
-    """,
-        (data["user_id"], event_id),
-    )
+            # Nothing inserted: tell a missing event or user from an existing member
+            cursor.execute(SQL_EVENT_AND_USER_EXIST, (event_id, data["user_id"]))
+            event_exists, user_exists = cursor.fetchone()
+            if not event_exists:
+                return json_response({"error": "Event not found"}, 404)
+            if not user_exists:
+                return json_response({"error": "User not found"}, 404)
+            return json_response({"success": True}, 200)
 
-    conn.commit()
-    conn.close()
+        conn.commit()
+        invalidate_cache()
 
-    return jsonify({"success": True}), 200
+        return json_response({"success": True}, 200)
+    except Exception as e:
+        conn.rollback()
+        return json_response({"error": str(e)}, 500)
 
 
 @app.route("/api/events/<event_id>", methods=["DELETE"])
@@ -433,260 +627,145 @@ def delete_event(event_id):
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    # Check if event exists
-    cursor.execute("SELECT id FROM EVENTS WHERE id = ?", (event_id,))
-    event = cursor.fetchone()
-    if not event:
-        conn.close()
-        return jsonify({"error": f"Event with ID {event_id} not found"}), 404
-
     try:
-        # Delete event participants
-        cursor.execute("DELETE FROM USER_EVENTS WHERE event_id = ?", (event_id,))
-
-        # Delete event
-        cursor.execute("DELETE FROM EVENTS WHERE id = ?", (event_id,))
+        # Delete event, its USER_EVENTS rows go with it via ON DELETE CASCADE.
+        # No row deleted means it did not exist
+        cursor.execute(SQL_DELETE_EVENT, (event_id,))
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return json_response({"error": f"Event with ID {event_id} not found"}, 404)
 
         conn.commit()
-        conn.close()
+        invalidate_cache()
 
-        return jsonify({"success": True}), 200
+        return json_response({"success": True}, 200)
     except Exception as e:
         conn.rollback()
-        conn.close()
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
 
 
 @app.route("/api/events/<event_id>", methods=["PATCH"])
 def update_event(event_id):
-    data = request.json
+    data = get_json_body()
     if not data:
-        return jsonify({"error": "No data provided"}), 400
+        return json_response({"error": "No data provided"}, 400)
 
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    # Check if event exists
-    cursor.execute(
-        "SELECT id, title, description, start_time, end_time FROM EVENTS WHERE id = ?",
-        (event_id,),
-    )
-    event = cursor.fetchone()
-    if not event:
-        conn.close()
-        return jsonify({"error": f"Event {event_id} not found"}), 404
-
     try:
+        conn.execute("BEGIN")
+
         # Update event fields
         update_fields = []
         update_values = []
 
-        for field in ["title", "description", "start_time", "end_time"]:
+        for field in EVENT_UPDATE_FIELDS:
             if field in data:
                 update_fields.append(f"{field} = ?")
                 update_values.append(data[field])
 
         if update_fields:
-            query = f"UPDATE EVENTS SET {', '.join(update_fields)} WHERE id = ?"
+            query = (
+                f"UPDATE EVENTS SET {', '.join(update_fields)} WHERE id = ? "
+                "RETURNING id, title, description, start_time, end_time"
+            )
             update_values.append(event_id)
             cursor.execute(query, update_values)
+        else:
+            cursor.execute(SQL_GET_EVENT, (event_id,))
+
+        # No row updated or found means the event does not exist
+        updated_event = cursor.fetchone()
+        if not updated_event:
+            conn.rollback()
+            return json_response({"error": f"Event {event_id} not found"}, 404)
 
         # Handle participants if present
         if "invited_users" in data:
             operation = data.get("user_operation", "set")
 
+            invited_users = orjson.dumps(data["invited_users"]).decode()
+            organizer_id = None
+
+            # Reject unknown users before the foreign keys do
+            error = check_event_references(cursor, data["invited_users"])
+            if error:
+                conn.rollback()
+                return error
+
             if operation == "set":
                 # Get organizer
                 cursor.execute(
-                    """
-                    SELECT user_id FROM USER_EVENTS 
-                    WHERE event_id = ? AND is_organizer = 1
-                """,
+                    SQL_GET_ORGANIZER,
                     (event_id,),
                 )
 
                 organizer = cursor.fetchone()
                 organizer_id = organizer["user_id"] if organizer else None
 
-                # Remove all participants except organizer
+                # Remove participants that are no longer invited, keeping the
+                # organizer
                 cursor.execute(
-                    """
-                    DELETE FROM USER_EVENTS 
-                    WHERE event_id = ? AND (is_organizer = 0 OR user_id != ?)
-                """,
-                    (event_id, organizer_id),
+                    SQL_DELETE_UNINVITED,
+                    (event_id, organizer_id, invited_users),
                 )
 
-                # Re-add organizer if they were removed
-                if organizer_id:
-                    cursor.execute(
-                        """
-                        INSERT OR IGNORE INTO USER_EVENTS (user_id, event_id, is_organizer)
-                        VALUES (?, ?, 1)
-                    """,
-                        (organizer_id, event_id),
-                    )
+            # Add invited users that are not already on the event
+            cursor.execute(
+                SQL_ADD_PARTICIPANTS,
+                (event_id, invited_users, organizer_id),
+            )
 
-                # Add all invited users
-                for user_id in data["invited_users"]:
-                    if user_id != organizer_id:
-                        cursor.execute(
-                            """
-                            INSERT OR IGNORE INTO USER_EVENTS (user_id, event_id, is_organizer)
-                            VALUES (?, ?, 0)
-                        """,
-                            (user_id, event_id),
-                        )
-            else:
-                # Just add new users
-                for user_id in data["invited_users"]:
-                    cursor.execute(
-                        """
-                        INSERT OR IGNORE INTO USER_EVENTS (user_id, event_id, is_organizer)
-                        VALUES (?, ?, 0)
-                    """,
-                        (user_id, event_id),
-                    )
+        # Get organizer and participants
+        cursor.execute(SQL_GET_EVENT_PEOPLE, (updated_event["id"],))
+        people = cursor.fetchone()
 
         conn.commit()
+        invalidate_cache()
 
-        # Get updated event details
-        cursor.execute(
-            """
-            SELECT id, title, description, start_time, end_time 
-            FROM EVENTS 
-            WHERE id = ?
-        """,
-            (event_id,),
-        )
-
-        updated_event = cursor.fetchone()
-
-        # Get organizer
-        cursor.execute(
-            """
-            SELECT user_id FROM USER_EVENTS 
-            WHERE event_id = ? AND is_organizer = 1
-        """,
-            (event_id,),
-        )
-
-        organizer = cursor.fetchone()
-        organizer_id = organizer["user_id"] if organizer else None
-
-        # Get participants
-        cursor.execute(
-            """
-            SELECT u.id, u.name
-            FROM USERS u
-            JOIN USER_EVENTS ue ON u.id = ue.user_id
-            WHERE ue.event_id = ?
-        """,
-            (event_id,),
-        )
-
-        participants = [
-            {"id": row["id"], "username": row["name"]} for row in cursor.fetchall()
-        ]
-
-        conn.close()
-
-        return jsonify(
-            {
-                "id": updated_event["id"],
-                "title": updated_event["title"],
-                "description": updated_event["description"],
-                "start_time": updated_event["start_time"],
-                "end_time": updated_event["end_time"],
-                "user_id": organizer_id,
-                "participants": participants,
-            }
-        )
+        return json_response(event_payload(*updated_event, *people))
+    except sqlite3.IntegrityError as e:
+        conn.rollback()
+        return json_response({"error": str(e)}, 400)
     except Exception as e:
         conn.rollback()
-        conn.close()
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
 
 
 @app.route("/api/events/<event_id>", methods=["GET"])
+@cached()
 def get_event(event_id):
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    # Get event details
-    cursor.execute(
-        """
-        SELECT id, title, description, start_time, end_time
-        FROM EVENTS 
-        WHERE id = ?
-    """,
-        (event_id,),
-    )
+    # Get event details with organizer and participants
+    cursor.execute(SQL_GET_EVENT_WITH_PEOPLE, (event_id,))
 
     event = cursor.fetchone()
     if not event:
-        conn.close()
-        return jsonify({"error": f"Event with ID {event_id} not found"}), 404
-
-    # Get organizer
-    cursor.execute(
-        """
-        SELECT user_id FROM USER_EVENTS 
-        WHERE event_id = ? AND is_organizer = 1
-    """,
-        (event_id,),
-    )
-
-    organizer = cursor.fetchone()
-    organizer_id = organizer["user_id"] if organizer else None
-
-    # Get participants
-    cursor.execute(
-        """
-        SELECT u.id, u.name
-        FROM USERS u
-        JOIN USER_EVENTS ue ON u.id = ue.user_id
-        WHERE ue.event_id = ?
-    """,
-        (event_id,),
-    )
+        return json_response({"error": f"Event with ID {event_id} not found"}, 404)
 
-    participants = [
-        {"id": row["id"], "username": row["name"]} for row in cursor.fetchall()
-    ]
-
-    conn.close()
-
-    return jsonify(
-        {
-            "id": event["id"],
-            "title": event["title"],
-            "description": event["description"],
-            "start_time": event["start_time"],
-            "end_time": event["end_time"],
-            "user_id": organizer_id,
-            "participants": participants,
-        }
-    )
+    return json_response(event_payload(*event))
 
 
 @app.route("/api/health", methods=["GET"])
 def health_check():
     db_exists = os.path.exists(DB_PATH)
-    return jsonify({"status": "healthy", "db_exists": db_exists, "db_path": DB_PATH})
+    return json_response(
+        {"status": "healthy", "db_exists": db_exists, "db_path": DB_PATH}
+    )
 
 
 @app.route("/api/admin/reset-database", methods=["POST"])
 def admin_reset_database():
-    return (
-        jsonify(
-            {
-                "error": "This endpoint is disabled in this implementation as the database is pre-populated"
-            }
-        ),
+    return json_response(
+        {
+            "error": "This endpoint is disabled in this implementation as the database is pre-populated"
+        },
         403,
     )
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(threaded=True)
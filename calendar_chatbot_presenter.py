@@ -1,13 +1,6 @@
-import datetime
-import json
-import os
-import sqlite3
-from typing import Any, Dict, List, Optional, Set, Tuple
-
-import requests
+import asyncio
 
 from calendar_controller import CalendarController
-from calendar_database_model import CalendarDatabaseModel
 
 
 class CalendarChatbotPresenter:
@@ -36,21 +29,38 @@ class CalendarChatbotPresenter:
     def setup_sample_data(self):
         print("Sample data created successfully!")
 
-    def run(self):
-        """Run the chatbot interface."""
+    async def handle_query(self, user_input: str):
+        """Answer a query and display the response."""
+        response = await self.controller.process_query_async(user_input)
+        self.display_response(response)
+
+    async def run_async(self):
+        """Run the chatbot interface, reading input while queries are answered."""
         self.display_welcome()
         self.setup_sample_data()
 
+        loop = asyncio.get_running_loop()
+        pending = set()
+
         while True:
-            user_input = input("You: ").strip()
+            user_input = (await loop.run_in_executor(None, input, "You: ")).strip()
 
             if user_input.lower() == "exit":
-                print("Goodbye!")
                 break
 
             elif user_input.lower() == "help":
                 self.display_welcome()
 
             else:
-                response = self.controller.process_query(user_input)
-                self.display_response(response)
+                task = asyncio.create_task(self.handle_query(user_input))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+
+        # Let queries still in flight finish before the database is closed
+        if pending:
+            await asyncio.gather(*pending)
+        print("Goodbye!")
+
+    def run(self):
+        """Run the chatbot interface."""
+        asyncio.run(self.run_async())
@@ -1,12 +1,215 @@
+import asyncio
+import calendar
 import datetime
-import json
-import os
+import hashlib
+import re
 import sqlite3
-from typing import Any, Dict, List, Optional, Set, Tuple
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 
+import orjson
 import requests
-
-from calendar_database_model import CalendarDatabaseModel
+from requests.adapters import HTTPAdapter
+
+from calendar_database_model import CalendarDatabaseModel, parse_timestamp
+
+
+# Seconds to keep the user and meeting room lists between reloads
+CACHE_TTL = 30
+
+# Keywords and phrases for classifying queries when the LLM is unreachable
+SCHEDULE_KEYWORDS = frozenset({"schedule", "scheduling", "book", "booking", "create"})
+SCHEDULE_PHRASES = ("set up", "new meeting")
+AVAILABILITY_KEYWORDS = frozenset({"available", "free", "availability"})
+AVAILABILITY_PHRASES = ("when can",)
+LIST_KEYWORDS = frozenset({"list", "show", "view", "upcoming"})
+LIST_PHRASES = ("my meetings",)
+CANCEL_KEYWORDS = frozenset({"cancel", "canceling", "cancelling", "delete", "remove"})
+WORD_RE = re.compile(r"[a-z]+")
+# Intents with their keywords and phrases, in order of precedence
+KEYWORD_INTENTS = (
+    ("schedule_meeting", SCHEDULE_KEYWORDS, SCHEDULE_PHRASES),
+    ("check_availability", AVAILABILITY_KEYWORDS, AVAILABILITY_PHRASES),
+    ("list_events", LIST_KEYWORDS, LIST_PHRASES),
+    ("cancel_meeting", CANCEL_KEYWORDS, ()),
+)
+
+# Time range phrases in list queries, found in one scan. None of them can
+# overlap another, so every phrase present is matched
+TIME_PHRASE_RE = re.compile(r"today|tomorrow|this week|next week")
+
+# Leading "meeting room"/"room" on a room the LLM gave by number
+ROOM_PREFIX_RE = re.compile(r"^\s*(?:meeting\s+room|room)\s+", re.I)
+
+# Working hours as seconds after midnight, for free-slot computation
+WORK_DAY_START = 9 * 3600
+WORK_DAY_END = 17 * 3600
+
+# Prepended to every prompt; kept short since every token costs inference time
+SYSTEM_PROMPT = (
+    "You are a meeting scheduling assistant for users, meeting rooms and events."
+)
+
+# Ollama structured output for classification, so the model answers with the
+# JSON object only
+INTENTS = (
+    "schedule_meeting",
+    "check_availability",
+    "list_events",
+    "cancel_meeting",
+    "other",
+)
+CLASSIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": {"type": "string", "enum": list(INTENTS)},
+        "slots": {"type": "object"},
+    },
+    "required": ["intent", "slots"],
+}
+
+# Seconds to wait for the Ollama connection and then between streamed chunks
+OLLAMA_TIMEOUT = (3.05, 120)
+
+# How long Ollama keeps the model loaded after the last call
+OLLAMA_KEEP_ALIVE = "30m"
+# The preloaded model stays loaded until the first query, which then applies
+# OLLAMA_KEEP_ALIVE
+OLLAMA_PRELOAD_KEEP_ALIVE = -1
+
+# Cap on generated tokens for JSON answers, ample for meeting details
+JSON_MAX_TOKENS = 512
+
+# Size and lifetime in seconds of the cache of LLM responses by prompt
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 3600
+
+
+# Today and the ISO dates of the default ranges for listing and cancelling
+class DateContext(NamedTuple):
+    today: datetime.date
+    today_iso: str
+    tomorrow_iso: str
+    week_iso: str
+    two_weeks_iso: str
+
+
+def date_context() -> DateContext:
+    today = datetime.date.today()
+    return DateContext(
+        today,
+        today.isoformat(),
+        (today + datetime.timedelta(days=1)).isoformat(),
+        (today + datetime.timedelta(days=7)).isoformat(),
+        (today + datetime.timedelta(days=14)).isoformat(),
+    )
+
+
+# Format Unix seconds from the model's epoch queries as a wall-clock HH:MM
+def format_epoch(seconds: int) -> str:
+    hours, minutes = divmod(seconds % 86400 // 60, 60)
+    return f"{hours:02d}:{minutes:02d}"
+
+
+# Yield the free (start, end) gaps in a working day, given busy (start, end,
+# ...) intervals sorted by start, all as Unix seconds. Sweeps the intervals
+# with the latest end seen so far, so callers wanting only the first gap
+# stop there
+def iter_free_periods(busy, work_start: int, work_end: int):
+    current_time = work_start
+    for start, end, *_ in busy:
+        if current_time < start:
+            yield current_time, start
+        if end > current_time:
+            current_time = end
+    if current_time < work_end:
+        yield current_time, work_end
+
+
+# Format a stored ISO 8601 time's HH:MM and YYYY-MM-DD for event listings.
+# Event times are stored as "YYYY-MM-DD HH:MM:SS" (or with a "T"), so these
+# are sliced out of the string, parsing only strings of another shape
+def format_hm(value: str) -> str:
+    if len(value) >= 16 and value[13] == ":":
+        return value[11:16]
+    parsed = parse_timestamp(value)
+    return f"{parsed.hour:02d}:{parsed.minute:02d}"
+
+
+def format_ymd(value: str) -> str:
+    if len(value) >= 10 and value[4] == "-" and value[7] == "-":
+        return value[:10]
+    parsed = parse_timestamp(value)
+    return f"{parsed.year:04d}-{parsed.month:02d}-{parsed.day:02d}"
+
+
+# Find the first balanced {...} in text that parses as a JSON object, in one
+# pass that skips over braces inside strings. Commentary around the JSON, or
+# stray braces before it, are ignored
+def extract_json_object(text: str) -> Optional[Dict]:
+    depth = 0
+    start = 0
+    in_string = False
+    escape = False
+
+    for i, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = depth > 0
+        elif char == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                try:
+                    result = orjson.loads(text[start : i + 1])
+                except orjson.JSONDecodeError:
+                    continue
+                if isinstance(result, dict):
+                    return result
+
+    return None
+
+
+# Build a character trie over (key, rank, value) entries for finding names in
+# queries. A key's end node holds its lowest (rank, value) under ""
+def build_match_trie(entries) -> Dict:
+    trie = {}
+    for key, rank, value in entries:
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        if "" not in node or rank < node[""][0]:
+            node[""] = (rank, value)
+    return trie
+
+
+# Find the lowest-ranked value whose key occurs anywhere in text. Walks the
+# trie from each position of text, so the cost depends on the text and the
+# longest key rather than on how many keys there are
+def find_in_trie(trie: Dict, text: str):
+    best = trie.get("")
+    for start in range(len(text)):
+        node = trie
+        for index in range(start, len(text)):
+            node = node.get(text[index])
+            if node is None:
+                break
+            entry = node.get("")
+            if entry is not None and (best is None or entry[0] < best[0]):
+                best = entry
+    return best[1] if best else None
 
 
 # Controller component
@@ -16,76 +219,320 @@ class CalendarController:
         model: CalendarDatabaseModel,
         ollama_url: str = "http://localhost:11434",
         model_name: str = "llama3",
+        max_parallel_requests: int = 4,
+        preload_model: bool = False,
     ):
-        """Initialize the controller with a database model and LLM settings."""
+        """Initialize the controller with a database model and LLM settings.
+
+        With preload_model, the LLM is loaded into Ollama in the background
+        so the first query doesn't wait for it.
+        """
         self.model = model
         self.ollama_url = ollama_url
         self.llm_model = model_name
+        # LLM calls run on a pool sized to the Ollama server's parallel slots
+        # (OLLAMA_NUM_PARALLEL). Database work runs on one thread per reader
+        # connection the model keeps open
+        self.llm_executor = ThreadPoolExecutor(max_workers=max_parallel_requests)
+        self.db_executor = ThreadPoolExecutor(max_workers=model.read_pool_size)
+        # One session keeps connections to Ollama alive between calls, with
+        # a pooled connection for each parallel LLM call
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_parallel_requests)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Users and meeting rooms rarely change, keep them for a short time
+        # as (loaded_at, rows) instead of reloading them in every handler
+        self._users_cache = None
+        self._rooms_cache = None
+        # LLM responses by prompt digest as (expires_at, response), least
+        # recently used first
+        self._response_cache = OrderedDict()
+        self._response_cache_lock = threading.Lock()
+        # Futures for the LLM requests being generated, by the same digest
+        self._inflight: Dict[bytes, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+        if preload_model:
+            self.llm_executor.submit(self._preload_model)
+
+    def _preload_model(self):
+        """Load the LLM into Ollama without generating anything."""
+        data = {"model": self.llm_model, "keep_alive": OLLAMA_PRELOAD_KEEP_ALIVE}
+        try:
+            self.session.post(
+                f"{self.ollama_url}/api/generate",
+                data=orjson.dumps(data),
+                headers={"Content-Type": "application/json"},
+                timeout=OLLAMA_TIMEOUT,
+            ).close()
+        except requests.exceptions.RequestException:
+            # Queries report an unreachable server themselves
+            pass
 
-    def generate_response(self, prompt: str) -> str:
+    def generate_response(
+        self,
+        prompt: str,
+        json_format: Union[str, Dict, None] = None,
+        max_tokens: Optional[int] = None,
+    ) -> str:
         """Send prompt to Ollama API and get response."""
-        api_url = f"{self.ollama_url}/api/generate"
+        try:
+            return self._generate(prompt, json_format, max_tokens)
+        except requests.exceptions.RequestException as e:
+            return f"Error connecting to Ollama: {str(e)}"
 
-        # Add system context to help the LLM understand its role
-        system_context = """
-        You are a helpful meeting scheduling assistant. You can:
-        1. Schedule meetings between users
-        2. Check availability of users and meeting rooms
-        3. Cancel meetings
-        4. List upcoming events for users
-        
-        Please respond to the user's request about meetings and scheduling.
+    def _generate(
+        self,
+        prompt: str,
+        json_format: Union[str, Dict, None] = None,
+        max_tokens: Optional[int] = None,
+    ) -> str:
+        """Send prompt to Ollama API, raising RequestException on failure.
+
+        json_format is passed to Ollama as the output format, either "json"
+        or a JSON schema, and reading stops as soon as the streamed answer
+        holds a complete JSON object. max_tokens caps the generated tokens.
         """
+        api_url = f"{self.ollama_url}/api/generate"
 
-        full_prompt = f"{system_context}\n\nUser request: {prompt}\n\nYour response:"
-
-        data = {"model": self.llm_model, "prompt": full_prompt, "stream": False}
+        full_prompt = f"{SYSTEM_PROMPT}\n\nUser request: {prompt}\n\nYour response:"
+
+        data = {
+            "model": self.llm_model,
+            "prompt": full_prompt,
+            "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+        }
+        if json_format is not None:
+            data["format"] = json_format
+        if max_tokens is not None:
+            data["options"] = {"num_predict": max_tokens}
+
+        # Identical requests get the cached answer instead of another inference
+        key = hashlib.blake2b(orjson.dumps(data, option=orjson.OPT_SORT_KEYS)).digest()
+        cached = self._get_cached_response(key)
+        if cached is not None:
+            return cached
+
+        # Concurrent identical requests share one inference: the first caller
+        # runs it and the others wait for its result
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result()
 
         try:
-            response = requests.post(api_url, json=data)
+            result = self._stream_generation(api_url, data, json_format is not None)
+            if result is not None:
+                self._store_cached_response(key, result)
+            else:
+                result = "I couldn't generate a response."
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+        return result
+
+    def _stream_generation(
+        self, api_url: str, data: Dict, json_only: bool
+    ) -> Optional[str]:
+        """Post a generate request and assemble the streamed answer, or None
+        if Ollama answered without any tokens."""
+        # Ollama streams one JSON object per line, each with the next tokens
+        parts = []
+        with self.session.post(
+            api_url,
+            data=orjson.dumps(data),
+            headers={"Content-Type": "application/json"},
+            stream=True,
+            timeout=OLLAMA_TIMEOUT,
+        ) as response:
             response.raise_for_status()
-            result = response.json()
-            return result.get("response", "I couldn't generate a response.")
-        except requests.exceptions.RequestException as e:
-            return f"Error connecting to Ollama: {str(e)}"
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    chunk = orjson.loads(line)
+                except orjson.JSONDecodeError as e:
+                    # Report a malformed body like any other failed request
+                    raise requests.exceptions.InvalidJSONError(
+                        str(e), response=response
+                    )
+                token = chunk.get("response")
+                if token:
+                    parts.append(token)
+                    # Hang up once the JSON the caller wants is complete
+                    if (
+                        json_only
+                        and "}" in token
+                        and extract_json_object("".join(parts)) is not None
+                    ):
+                        break
+                if chunk.get("done"):
+                    break
+
+        return "".join(parts) if parts else None
+
+    def _get_cached_response(self, key: bytes) -> Optional[str]:
+        """Get an unexpired cached LLM response, marking it as recently used."""
+        with self._response_cache_lock:
+            entry = self._response_cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._response_cache[key]
+                return None
+            self._response_cache.move_to_end(key)
+            return entry[1]
+
+    def _store_cached_response(self, key: bytes, response: str):
+        """Cache an LLM response, evicting the least recently used one if full."""
+        with self._response_cache_lock:
+            self._response_cache[key] = (
+                time.monotonic() + RESPONSE_CACHE_TTL,
+                response,
+            )
+            self._response_cache.move_to_end(key)
+            if len(self._response_cache) > RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+
+    async def generate_response_async(self, prompt: str) -> str:
+        """Send prompt to Ollama API without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.llm_executor, self.generate_response, prompt
+        )
 
     def process_query(self, user_query: str) -> str:
         """Process the user query and either perform actions on the calendar or get LLM response."""
-        # Extract potential intent from the query
-        intent = self._extract_intent(user_query.lower())
+        intent, slots = self._classify(user_query)
+
+        response = self._handle_intent(intent, user_query, slots)
+        if response is None:
+            # For other intents, generate a response from the LLM
+            response = self.generate_response(user_query)
+        return response
+
+    async def process_query_async(self, user_query: str) -> str:
+        """Process the user query, awaiting LLM calls instead of blocking a thread."""
+        loop = asyncio.get_running_loop()
+        intent, slots = await loop.run_in_executor(
+            self.llm_executor, self._classify, user_query
+        )
+
+        if intent != "other":
+            return await loop.run_in_executor(
+                self.db_executor, self._handle_intent, intent, user_query, slots
+            )
+
+        # For other intents, generate a response from the LLM
+        return await self.generate_response_async(user_query)
 
+    async def process_queries(self, queries: List[str]) -> List[str]:
+        """Process several queries concurrently, returning responses in order."""
+        # At most max_parallel_requests LLM calls are in flight at once since
+        # they share the LLM pool, the rest wait for a free slot
+        return await asyncio.gather(*(self.process_query_async(q) for q in queries))
+
+    def _handle_intent(self, intent: str, query: str, slots: Dict) -> Optional[str]:
+        """Run the handler for an intent, returning None for other intents."""
         if intent == "schedule_meeting":
-            return self._handle_scheduling(user_query)
+            return self._handle_scheduling(query, slots)
         elif intent == "check_availability":
-            return self._handle_availability_check(user_query)
+            return self._handle_availability_check(query)
         elif intent == "list_events":
-            return self._handle_list_events(user_query)
+            return self._handle_list_events(query)
         elif intent == "cancel_meeting":
-            return self._handle_cancel_meeting(user_query)
-        else:
-            # For other intents, generate a response from the LLM
-            response = self.generate_response(user_query)
-            return response
-
-    def _extract_intent(self, query: str) -> str:
-        """Extract intent using the LLM."""
-        # Create a prompt for the LLM to classify the intent
-        intent_prompt = f"""
-        Analyze the following user query and determine the intent. 
-        Respond with exactly one of these categories: 
-        - schedule_meeting: For queries about creating or booking new meetings
-        - check_availability: For queries about when users or rooms are available
-        - list_events: For queries about showing or listing existing meetings
-        - cancel_meeting: For queries about canceling or removing meetings
-        - other: For queries that don't fit the above categories
-        
+            return self._handle_cancel_meeting(query)
+        return None
+
+    def _classify(self, query: str) -> Tuple[str, Dict]:
+        """Classify the query and extract meeting details in one LLM call."""
+        # Collapse whitespace so queries differing only in spacing share a
+        # cached classification
+        query = " ".join(query.split())
+
+        # Queries whose keywords point at a single intent with a rule-based
+        # handler don't need the LLM. Scheduling still goes through it since
+        # the same call extracts the meeting details
+        matches = self._keyword_intents(query)
+        if len(matches) == 1 and matches[0] != "schedule_meeting":
+            return matches[0], {}
+
+        try:
+            response = self._generate(
+                self._classification_prompt(query),
+                CLASSIFICATION_SCHEMA,
+                JSON_MAX_TOKENS,
+            )
+        except requests.exceptions.RequestException:
+            # Fall back to rule-based intent extraction if the LLM is unreachable
+            return self._keyword_intent(query), {}
+        return self._parse_classification(response, query)
+
+    def _classification_prompt(self, query: str) -> str:
+        """Build a prompt that classifies the intent and extracts meeting details."""
+        current_date = datetime.datetime.now()
+        return f"""
+        Today's date is {current_date.strftime('%A, %B %d, %Y')}.
+
+        Analyze the following user query and return a JSON object with two fields:
+        - intent: Exactly one of these categories:
+          - schedule_meeting: For queries about creating or booking new meetings
+          - check_availability: For queries about when users or rooms are available
+          - list_events: For queries about showing or listing existing meetings
+          - cancel_meeting: For queries about canceling or removing meetings
+          - other: For queries that don't fit the above categories
+        - slots: For schedule_meeting, the meeting details below. For any other
+          intent, an empty object.
+        {self._meeting_details_instructions(current_date)}
         User query: "{query}"
-        
-        Intent:
         """
 
-        # Get the response from the LLM
-        response = self.generate_response(intent_prompt).strip().lower()
+    def _parse_classification(self, response: str, query: str) -> Tuple[str, Dict]:
+        """Parse the intent and meeting details from a classification response."""
+        result = extract_json_object(response)
+        if result is not None:
+            slots = result.get("slots")
+            intent = self._parse_intent(str(result.get("intent", "")))
+            return intent, slots if isinstance(slots, dict) else {}
+
+        # Fall back to reading a bare category from the response, and to the
+        # query's keywords if the response is neither (e.g. no tokens came back)
+        intent = self._parse_intent(response)
+        if intent == "other":
+            intent = self._keyword_intent(query)
+        return intent, {}
+
+    def _meeting_details_instructions(self, current_date: datetime.datetime) -> str:
+        """Describe the meeting detail fields and date rules for extraction prompts."""
+        return f"""
+        Meeting details fields:
+        - title: A concise meeting title
+        - description: Brief description of the meeting purpose
+        - attendees: Array of names of people attending
+        - start_time: ISO format date/time for the meeting start (infer a reasonable time if not specified)
+        - end_time: ISO format date/time for the meeting end (assume 1 hour duration if not specified)
+        - meeting_room: Meeting room name or number (if specified)
+
+        For dates, if "tomorrow" is mentioned, use tomorrow's date. If a day of week is mentioned like "Monday",
+        use the date for the next occurrence of that day. If no specific date is mentioned, assume tomorrow.
+        For times, if not specified, assume business hours (9 AM start time).
+
+        IMPORTANT: All dates must be in {current_date.year}. Do not use any dates from past years.
+        """
+
+    def _parse_intent(self, response: str) -> str:
+        """Map the LLM's classification response to an intent."""
+        response = response.strip().lower()
 
         # Extract the intent from the response
         if "schedule_meeting" in response:
@@ -99,89 +546,52 @@ class CalendarController:
         else:
             return "other"
 
-        # Fallback to rule-based intent extraction if LLM classification fails
-        try:
-            # Get the response from the LLM
-            response = self.generate_response(intent_prompt).strip().lower()
-
-            # Extract the intent from the response
-            if "schedule_meeting" in response:
-                return "schedule_meeting"
-            elif "check_availability" in response:
-                return "check_availability"
-            elif "list_events" in response:
-                return "list_events"
-            elif "cancel_meeting" in response:
-                return "cancel_meeting"
-            else:
-                return "other"
-        except Exception as e:
-            # If there's an error with the LLM, fall back to rule-based approach
-            if any(
-                word in query.lower()
-                for word in ["schedule", "set up", "book", "create", "new meeting"]
-            ):
-                return "schedule_meeting"
-            elif any(
-                word in query.lower()
-                for word in ["available", "free", "availability", "when can"]
-            ):
-                return "check_availability"
-            elif any(
-                word in query.lower()
-                for word in ["list", "show", "view", "my meetings", "upcoming"]
-            ):
-                return "list_events"
-            elif any(word in query.lower() for word in ["cancel", "delete", "remove"]):
-                return "cancel_meeting"
-            else:
-                return "other"
+    def _keyword_intent(self, query: str) -> str:
+        """Extract intent from keywords in the query."""
+        matches = self._keyword_intents(query)
+        return matches[0] if matches else "other"
 
-    def _handle_scheduling(self, query: str) -> str:
+    def _keyword_intents(self, query: str) -> List[str]:
+        """Get every intent whose keywords appear in the query, in order of
+        precedence."""
+        query_lower = query.lower()
+        tokens = set(WORD_RE.findall(query_lower))
+        return [
+            intent
+            for intent, keywords, phrases in KEYWORD_INTENTS
+            if keywords & tokens or any(phrase in query_lower for phrase in phrases)
+        ]
+
+    def _handle_scheduling(
+        self, query: str, meeting_data: Optional[Dict] = None
+    ) -> str:
         """Handle meeting scheduling requests by extracting info and creating the meeting."""
         # Get current date information for proper context
         current_date = datetime.datetime.now()
         current_year = current_date.year
-        current_month = current_date.month
-        current_day = current_date.day
-
-        # Create a structured prompt for the LLM to extract meeting details
-        extraction_prompt = f"""
-        Today's date is {current_date.strftime('%A, %B %d, %Y')}.
-        
-        Extract the following information for scheduling a meeting from this request: '{query}'.
-        Format as JSON with these fields:
-        - title: A concise meeting title
-        - description: Brief description of the meeting purpose
-        - attendees: Array of names of people attending
-        - start_time: ISO format date/time for the meeting start (infer a reasonable time if not specified)
-        - end_time: ISO format date/time for the meeting end (assume 1 hour duration if not specified)
-        - meeting_room: Meeting room name or number (if specified)
-        
-        For dates, if "tomorrow" is mentioned, use tomorrow's date. If a day of week is mentioned like "Monday", 
-        use the date for the next occurrence of that day. If no specific date is mentioned, assume tomorrow.
-        For times, if not specified, assume business hours (9 AM start time).
-        
-        IMPORTANT: All dates must be in {current_year}. Do not use any dates from past years.
-        
-        Return ONLY the JSON with no additional text.
-        """
-
-        # Get the structured data from the LLM
-        llm_response = self.generate_response(extraction_prompt)
 
         try:
-            # Try to parse the JSON response
-            # First, find JSON content if it's wrapped in any markdown or other text
-            json_start = llm_response.find("{")
-            json_end = llm_response.rfind("}") + 1
-
-            if json_start >= 0 and json_end > json_start:
-                json_str = llm_response[json_start:json_end]
-                meeting_data = json.loads(json_str)
-            else:
-                # Fallback if no JSON found
-                return "I couldn't understand the meeting details. Please try again with more specific information."
+            # Meeting details already extracted during classification skip the
+            # extraction call
+            if not meeting_data:
+                # Create a structured prompt for the LLM to extract meeting details
+                extraction_prompt = f"""
+                Today's date is {current_date.strftime('%A, %B %d, %Y')}.
+
+                Extract the meeting details for scheduling a meeting from this request: '{query}'.
+                Format as JSON.
+                {self._meeting_details_instructions(current_date)}"""
+
+                # Get the structured data from the LLM
+                llm_response = self.generate_response(
+                    extraction_prompt, "json", JSON_MAX_TOKENS
+                )
+
+                # Find the JSON content even if it's wrapped in markdown or other text
+                meeting_data = extract_json_object(llm_response)
+                if meeting_data is None:
+                    # Fallback if no JSON found
+                    return "I couldn't understand the meeting details. Please try again with more specific information."
 
             # Validate required fields
             required_fields = ["title", "attendees", "start_time", "end_time"]
@@ -195,12 +605,8 @@ class CalendarController:
 
             try:
                 # Parse the dates
-                start_time = datetime.datetime.fromisoformat(
-                    start_time_str.replace("Z", "+00:00")
-                )
-                end_time = datetime.datetime.fromisoformat(
-                    end_time_str.replace("Z", "+00:00")
-                )
+                start_time = parse_timestamp(start_time_str)
+                end_time = parse_timestamp(end_time_str)
 
                 # Check if the year is correct (current year)
                 if start_time.year != current_year:
@@ -215,63 +621,52 @@ class CalendarController:
             except (ValueError, TypeError):
                 return "The date format provided is invalid. Please use a standard date format."
 
-            # Look up attendee IDs
-            attendee_ids = []
-            organizer_id = None
+            # Look up attendee IDs, using the first partial name match for each
+            attendee_names = [str(name) for name in meeting_data["attendees"]]
+            resolved = self.model.get_users_by_names(attendee_names)
+            attendees = {}
             missing_attendees = []
 
-            # Process attendees
-            for attendee_name in meeting_data["attendees"]:
-                # Look for partial name matches
-                users = self.model.get_user_by_name(attendee_name)
-
-                if users:
-                    # Use the first matching user
-                    attendee_ids.append(users[0]["id"])
-                    # Set the first attendee as the organizer if not set yet
-                    if organizer_id is None:
-                        organizer_id = users[0]["id"]
+            for attendee_name in attendee_names:
+                user = resolved.get(attendee_name)
+                if user:
+                    attendees.setdefault(user["id"], user["name"])
                 else:
                     missing_attendees.append(attendee_name)
 
+            attendee_ids = list(attendees)
+            # The first attendee organizes the meeting
+            organizer_id = attendee_ids[0] if attendee_ids else None
+
             if missing_attendees:
                 attendee_list = ", ".join(missing_attendees)
                 return f"I couldn't find these users in the system: {attendee_list}. Please check the names and try again."
 
-            # Look up meeting room ID if specified
-            meeting_room_id = None
+            if not attendee_ids:
+                return "Please tell me who should attend the meeting, so I know who organizes it."
+
+            # Look up the meeting room if specified
+            meeting_room = None
             if "meeting_room" in meeting_data and meeting_data["meeting_room"]:
-                room_name = meeting_data["meeting_room"]
+                room_name = meeting_data["meeting_room"].lower()
+                room_number = ROOM_PREFIX_RE.sub("", room_name).strip()
+                match_keys = self._rooms()[2]
 
                 # Handle room specified by number
-                if (
-                    room_name.lower()
-                    .replace("meeting room ", "")
-                    .replace("room ", "")
-                    .isdigit()
-                ):
-                    room_number = (
-                        room_name.lower()
-                        .replace("meeting room ", "")
-                        .replace("room ", "")
-                    )
-                    rooms = self.model.get_all_meeting_rooms()
-                    for room in rooms:
-                        if str(room["id"]) == room_number or room[
-                            "name"
-                        ].lower().endswith(f" {room_number}"):
-                            meeting_room_id = room["id"]
+                if room_number.isdigit():
+                    for name, _, room in match_keys:
+                        if str(room["id"]) == room_number or name.endswith(
+                            f" {room_number}"
+                        ):
+                            meeting_room = room
                             break
                 else:
                     # Look for room by name
-                    rooms = self.model.get_all_meeting_rooms()
-                    for room in rooms:
-                        if (
-                            room["name"].lower() == room_name.lower()
-                            or room_name.lower() in room["name"].lower()
-                        ):
-                            meeting_room_id = room["id"]
+                    for name, _, room in match_keys:
+                        if room_name in name:
+                            meeting_room = room
                             break
+            meeting_room_id = meeting_room["id"] if meeting_room else None
 
             # Ensure description exists
             description = meeting_data.get("description", "No description provided")
@@ -289,42 +684,22 @@ class CalendarController:
                 )
 
                 # Format the response
-                start_time = datetime.datetime.fromisoformat(
-                    meeting_data["start_time"].replace("Z", "+00:00")
-                )
-                end_time = datetime.datetime.fromisoformat(
-                    meeting_data["end_time"].replace("Z", "+00:00")
+                start_time = parse_timestamp(meeting_data["start_time"])
+                end_time = parse_timestamp(meeting_data["end_time"])
+
+                room_info = f" in {meeting_room['name']}" if meeting_room_id else ""
+                location = room_info or "Online meeting"
+                return (
+                    f"✓ Meeting scheduled: \"{meeting_data['title']}\"\n"
+                    f"Date: {start_time:%A, %B %d, %Y}\n"
+                    f"Time: {start_time:%I:%M %p} - {end_time:%I:%M %p}\n"
+                    f"Attendees: {', '.join(attendees.values())}\n"
+                    f"Location: {location}\n"
                 )
 
-                attendee_names = [
-                    user["name"]
-                    for user in self.model.get_all_users()
-                    if user["id"] in attendee_ids
-                ]
-                room_info = ""
-                if meeting_room_id:
-                    rooms = self.model.get_all_meeting_rooms()
-                    for room in rooms:
-                        if room["id"] == meeting_room_id:
-                            room_info = f" in {room['name']}"
-                            break
-
-                response = f"✓ Meeting scheduled: \"{meeting_data['title']}\"\n"
-                response += f"Date: {start_time.strftime('%A, %B %d, %Y')}\n"
-                response += f"Time: {start_time.strftime('%I:%M %p')} - {end_time.strftime('%I:%M %p')}\n"
-                response += f"Attendees: {', '.join(attendee_names)}\n"
-                if room_info:
-                    response += f"Location: {room_info}\n"
-                else:
-                    response += "Location: Online meeting\n"
-
-                return response
-
             except sqlite3.Error as e:
                 return f"Error creating the meeting: {str(e)}"
 
-        except json.JSONDecodeError:
-            return "I couldn't understand the meeting details. Please provide a clearer description of when, where, and who should attend the meeting."
         except Exception as e:
             return f"An error occurred: {str(e)}"
 
@@ -334,16 +709,15 @@ class CalendarController:
 
         # Check if it's a user availability query
         user_id = None
-        for user in self.model.get_all_users():
-            if user["name"].lower() in query_lower:
-                user_id = user["id"]
-                user_name = user["name"]
-                break
+        user = self._find_user_in_query(query_lower)
+        if user:
+            user_id = user["id"]
+            user_name = user["name"]
 
         # If asking about a user's availability
         if user_id:
             # Try to extract date from query
-            today = datetime.datetime.now().date()
+            today = datetime.date.today()
             check_date = today
 
             if "tomorrow" in query_lower:
@@ -356,8 +730,8 @@ class CalendarController:
             start_of_day = f"{date_str}T00:00:00"
             end_of_day = f"{date_str}T23:59:59"
 
-            # Get events for that user on that day
-            events = self.model.get_user_events(user_id, start_of_day, end_of_day)
+            # Get events for that user on that day, with Unix-second times
+            events = self.model.get_user_events_epoch(user_id, start_of_day, end_of_day)
 
             if not events:
                 date_desc = (
@@ -365,96 +739,59 @@ class CalendarController:
                 )
                 return f"{user_name} is available all day {date_desc}."
 
-            # Build time blocks of availability
-            busy_periods = []
-            for event in events:
-                start_time = datetime.datetime.fromisoformat(
-                    event["start_time"].replace("Z", "+00:00")
-                )
-                end_time = datetime.datetime.fromisoformat(
-                    event["end_time"].replace("Z", "+00:00")
-                )
-                busy_periods.append((start_time, end_time, event["title"]))
-
-            # Sort by start time
-            busy_periods.sort(key=lambda x: x[0])
-
             date_desc = (
                 "today" if check_date == today else check_date.strftime("%A, %B %d")
             )
-            response = f"{user_name}'s availability for {date_desc}:\n\n"
+            parts = [f"{user_name}'s availability for {date_desc}:\n\n"]
 
-            # Add busy periods
-            response += "Busy during:\n"
-            for start, end, title in busy_periods:
-                response += (
-                    f"- {start.strftime('%H:%M')} - {end.strftime('%H:%M')}: {title}\n"
+            # Add busy periods, which come back sorted by start time
+            parts.append("Busy during:\n")
+            for start, end, title in events:
+                parts.append(
+                    f"- {format_epoch(start)} - {format_epoch(end)}: {title}\n"
                 )
 
             # Calculate free periods (assuming 9 AM - 5 PM workday)
-            work_start = datetime.datetime.combine(check_date, datetime.time(9, 0))
-            work_end = datetime.datetime.combine(check_date, datetime.time(17, 0))
-
-            free_periods = []
-            current_time = work_start
-
-            for start, end, _ in busy_periods:
-                if current_time < start:
-                    free_periods.append((current_time, start))
-                current_time = max(current_time, end)
-
-            if current_time < work_end:
-                free_periods.append((current_time, work_end))
+            day_start = calendar.timegm(check_date.timetuple())
+            free_periods = list(
+                iter_free_periods(
+                    events, day_start + WORK_DAY_START, day_start + WORK_DAY_END
+                )
+            )
 
             # Add free periods
-            response += "\nAvailable during:\n"
+            parts.append("\nAvailable during:\n")
             if not free_periods:
-                response += "- No availability during work hours (9 AM - 5 PM)\n"
+                parts.append("- No availability during work hours (9 AM - 5 PM)\n")
             else:
                 for start, end in free_periods:
-                    response += (
-                        f"- {start.strftime('%H:%M')} - {end.strftime('%H:%M')}\n"
-                    )
+                    parts.append(f"- {format_epoch(start)} - {format_epoch(end)}\n")
 
-            return response
+            return "".join(parts)
 
         # Check if it's a meeting room availability query
         room_id = None
-        for room in self.model.get_all_meeting_rooms():
-            room_name = room["name"].lower()
-            if room_name in query_lower or f"room {room['id']}" in query_lower:
-                room_id = room["id"]
-                room_name = room["name"]
-                break
+        room = self._find_room_in_query(query_lower)
+        if room:
+            room_id = room["id"]
+            room_name = room["name"]
 
         # If asking about a specific room
         if room_id:
             # Try to extract date from query
-            today = datetime.datetime.now().date()
+            today = datetime.date.today()
             check_date = today
 
             if "tomorrow" in query_lower:
                 check_date = today + datetime.timedelta(days=1)
 
-            # Format date for database query
-            date_str = check_date.isoformat()
-            start_of_day = f"{date_str}T00:00:00"
-            end_of_day = f"{date_str}T23:59:59"
+            # The day as a half-open range, up to the next midnight
+            start_of_day = f"{check_date.isoformat()}T00:00:00"
+            next_day = check_date + datetime.timedelta(days=1)
+            end_of_day = f"{next_day.isoformat()}T00:00:00"
 
             # Get events in that room on that day
-            self.cursor.execute(
-                """
-            SELECT title, start_time, end_time 
-            FROM events 
-            WHERE meeting_room_id = ? 
-            AND start_time >= ? 
-            AND start_time <= ?
-            ORDER BY start_time
-            """,
-                (room_id, start_of_day, end_of_day),
-            )
-
-            events = self.cursor.fetchall()
+            events = self.model.get_room_events(room_id, start_of_day, end_of_day)
 
             date_desc = (
                 "today" if check_date == today else check_date.strftime("%A, %B %d")
@@ -463,32 +800,31 @@ class CalendarController:
             if not events:
                 return f"{room_name} is available all day {date_desc}."
 
-            response = f"{room_name} availability for {date_desc}:\n\n"
-            response += "Booked for:\n"
+            parts = [f"{room_name} availability for {date_desc}:\n\n", "Booked for:\n"]
 
             for event in events:
-                start_time = datetime.datetime.fromisoformat(
-                    event["start_time"].replace("Z", "+00:00")
+                start_time = event["start_time"]
+                end_time = event["end_time"]
+                parts.append(
+                    f"- {format_hm(start_time)} - {format_hm(end_time)}: {event['title']}\n"
                 )
-                end_time = datetime.datetime.fromisoformat(
-                    event["end_time"].replace("Z", "+00:00")
-                )
-                response += f"- {start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')}: {event['title']}\n"
 
-            return response
+            return "".join(parts)
 
         # If no specific user or room was found, return info about all meeting rooms
-        rooms = self.model.get_all_meeting_rooms()
+        rooms = self._rooms()[1]
 
-        response = "Here are the available meeting rooms:\n\n"
+        parts = ["Here are the available meeting rooms:\n\n"]
         for room in rooms:
             room_type = "Virtual" if room["is_virtual"] else "Physical"
-            response += (
+            parts.append(
                 f"- {room['name']} (Capacity: {room['capacity']}, Type: {room_type})\n"
             )
 
-        response += "\nFor specific availability, please specify a user or room name and a date."
-        return response
+        parts.append(
+            "\nFor specific availability, please specify a user or room name and a date."
+        )
+        return "".join(parts)
 
     def _handle_list_events(self, query: str) -> str:
         """Handle requests to list events."""
@@ -496,38 +832,36 @@ class CalendarController:
         query_lower = query.lower()
         user_id = None
 
-        # Get all users and look for mention in the query
-        users = self.model.get_all_users()
-        for user in users:
-            # Check for user's name in the query (case insensitive)
-            if user["name"].lower() in query_lower:
-                user_id = user["id"]
-                user_name = user["name"]
-                break
+        # Look for a user mentioned in the query (case insensitive)
+        user = self._find_user_in_query(query_lower)
+        if user:
+            user_id = user["id"]
+            user_name = user["name"]
 
         # If no user found or ambiguous, handle accordingly
         if not user_id:
             return "I'm not sure whose meetings you're asking about. Please specify a user by name."
 
         # Determine time range from query
-        today = datetime.datetime.now().date()
-        start_date = today.isoformat()
+        dates = date_context()
+        start_date = dates.today_iso
 
         # Default to one week
-        end_date = (today + datetime.timedelta(days=7)).isoformat()
+        end_date = dates.week_iso
 
         # Check for specific time ranges
-        if "today" in query_lower:
-            end_date = today.isoformat()
-        elif "tomorrow" in query_lower:
-            start_date = (today + datetime.timedelta(days=1)).isoformat()
+        phrases = set(TIME_PHRASE_RE.findall(query_lower))
+        if "today" in phrases:
+            end_date = dates.today_iso
+        elif "tomorrow" in phrases:
+            start_date = dates.tomorrow_iso
             end_date = start_date
-        elif "this week" in query_lower:
+        elif "this week" in phrases:
             # Keep the default week range
             pass
-        elif "next week" in query_lower:
-            start_date = (today + datetime.timedelta(days=7)).isoformat()
-            end_date = (today + datetime.timedelta(days=14)).isoformat()
+        elif "next week" in phrases:
+            start_date = dates.week_iso
+            end_date = dates.two_weeks_iso
 
         # Get events for the specified user and time range
         events = self.model.get_user_events(user_id, start_date, end_date)
@@ -535,36 +869,27 @@ class CalendarController:
         if not events:
             time_description = (
                 "today"
-                if start_date == end_date and start_date == today.isoformat()
+                if start_date == end_date and start_date == dates.today_iso
                 else "in the specified time period"
             )
             return f"{user_name} doesn't have any meetings {time_description}."
 
-        response = f"{user_name}'s meetings:\n\n"
+        parts = [f"{user_name}'s meetings:\n\n"]
         for event in events:
-            start_time = datetime.datetime.fromisoformat(
-                event["start_time"].replace("Z", "+00:00")
-            )
-            end_time = datetime.datetime.fromisoformat(
-                event["end_time"].replace("Z", "+00:00")
+            start_time = event["start_time"]
+            end_time = event["end_time"]
+            location = event["meeting_room_name"] or "Online"
+            attendee_names = ", ".join(att["name"] for att in event["attendees"])
+
+            parts.append(
+                f"- {event['title']}\n"
+                f"  Date: {format_ymd(start_time)}\n"
+                f"  Time: {format_hm(start_time)} - {format_hm(end_time)}\n"
+                f"  Location: {location}\n"
+                f"  Attendees: {attendee_names}\n\n"
             )
 
-            response += f"- {event['title']}\n"
-            response += f"  Date: {start_time.strftime('%Y-%m-%d')}\n"
-            response += f"  Time: {start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')}\n"
-
-            if event["meeting_room_name"]:
-                response += f"  Location: {event['meeting_room_name']}\n"
-            else:
-                response += f"  Location: Online\n"
-
-            # Add attendees information
-            response += "  Attendees: "
-            attendee_names = [att["name"] for att in event["attendees"]]
-            response += ", ".join(attendee_names)
-            response += "\n\n"
-
-        return response
+        return "".join(parts)
 
     def _handle_cancel_meeting(self, query: str) -> str:
         """Handle meeting cancellation requests."""
@@ -572,52 +897,100 @@ class CalendarController:
         query_lower = query.lower()
         user_id = None
 
-        # Get all users and look for mention in the query
-        users = self.model.get_all_users()
-        for user in users:
-            # Check for user's name in the query (case insensitive)
-            if user["name"].lower() in query_lower:
-                user_id = user["id"]
-                user_name = user["name"]
-                break
+        # Look for a user mentioned in the query (case insensitive)
+        user = self._find_user_in_query(query_lower)
+        if user:
+            user_id = user["id"]
+            user_name = user["name"]
 
         # If no user found, use generic approach
         if not user_id:
             return "I'm not sure whose meetings you're asking about. Please specify a user by name."
 
-        today = datetime.datetime.now().date().isoformat()
-        one_week_later = (
-            (datetime.datetime.now() + datetime.timedelta(days=7)).date().isoformat()
+        dates = date_context()
+        events = self.model.get_user_events(
+            user_id, dates.today_iso, dates.week_iso, include_attendees=False
         )
 
-        events = self.model.get_user_events(user_id, today, one_week_later)
-
         if not events:
             return f"{user_name} doesn't have any upcoming meetings to cancel."
 
-        response = (
+        parts = [
             f"Here are {user_name}'s upcoming meetings that could be cancelled:\n\n"
-        )
+        ]
         for event in events:
-            start_time = datetime.datetime.fromisoformat(
-                event["start_time"].replace("Z", "+00:00")
+            start_time = event["start_time"]
+
+            parts.append(
+                f"- ID: {event['id']}, {event['title']} on {format_ymd(start_time)} at {format_hm(start_time)}\n"
             )
 
-            response += f"- ID: {event['id']}, {event['title']} on {start_time.strftime('%Y-%m-%d at %H:%M')}\n"
+        parts.append("\nTo cancel a meeting, please specify the meeting ID.")
+        return "".join(parts)
 
-        response += "\nTo cancel a meeting, please specify the meeting ID."
-        return response
+    def _users(self) -> Tuple[float, List[sqlite3.Row], Dict]:
+        """Get the users cache as (loaded_at, users, name_trie), reloading it
+        at most every CACHE_TTL seconds.
+
+        Handlers run on several threads, so callers use the returned tuple
+        rather than reading self._users_cache again.
+        """
+        now = time.monotonic()
+        cache = self._users_cache
+        if not cache or now - cache[0] > CACHE_TTL:
+            users = self.model.get_all_users()
+            # Lowercased names for matching against queries, first user wins
+            name_trie = build_match_trie(
+                (user["name"].lower(), rank, user) for rank, user in enumerate(users)
+            )
+            cache = self._users_cache = (now, users, name_trie)
+        return cache
+
+    def _rooms(self) -> Tuple[float, List[sqlite3.Row], List[Tuple], Dict]:
+        """Get the rooms cache as (loaded_at, rooms, match_keys, room_trie),
+        reloading it at most every CACHE_TTL seconds."""
+        now = time.monotonic()
+        cache = self._rooms_cache
+        if not cache or now - cache[0] > CACHE_TTL:
+            rooms = self.model.get_all_meeting_rooms()
+            # Lowercased name and "room <id>" for matching against queries
+            match_keys = [
+                (room["name"].lower(), f"room {room['id']}", room) for room in rooms
+            ]
+            # Either key finds the room, the first room listed wins
+            room_trie = build_match_trie(
+                (key, rank, room)
+                for rank, (name, room_ref, room) in enumerate(match_keys)
+                for key in (name, room_ref)
+            )
+            cache = self._rooms_cache = (now, rooms, match_keys, room_trie)
+        return cache
+
+    def _find_user_in_query(self, query_lower: str) -> Optional[sqlite3.Row]:
+        """Find the first user whose name appears in the lowercased query."""
+        return find_in_trie(self._users()[2], query_lower)
+
+    def _find_room_in_query(self, query_lower: str) -> Optional[sqlite3.Row]:
+        """Find the first meeting room mentioned in the lowercased query."""
+        return find_in_trie(self._rooms()[3], query_lower)
 
     # Additional calendar-specific functions
     def create_user(self, name: str, email: str) -> int:
         """Create a new user."""
-        return self.model.add_user(name, email)
+        user_id = self.model.add_user(name, email)
+        # Drop the cache once the user is committed, so a reload can't bring
+        # back the old list
+        self._users_cache = None
+        return user_id
 
     def create_meeting_room(
         self, name: str, capacity: int, is_virtual: bool = False
     ) -> int:
         """Create a new meeting room."""
-        return self.model.add_meeting_room(name, capacity, is_virtual)
+        room_id = self.model.add_meeting_room(name, capacity, is_virtual)
+        # Drop the cache once the room is committed
+        self._rooms_cache = None
+        return room_id
 
     def schedule_meeting(
         self,
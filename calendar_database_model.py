@@ -1,25 +1,342 @@
+import calendar
 import datetime
+import functools
 import json
-import os
+import queue
 import sqlite3
-from typing import Any, Dict, List, Optional, Set, Tuple
-
-import requests
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from calendar_schema import apply_shared_schema
+
+# Connection settings: 8 KB pages for newly created databases (an existing
+# file keeps its page size), WAL so readers don't block on commits, fewer
+# fsyncs, a 64 MB page cache and enforced foreign keys (cancelling an event
+# cascades to its attendee rows). Writers wait up to 30 seconds for another
+# process's write lock instead of failing with "database is locked"
+DB_PRAGMAS = (
+    "page_size=8192",
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-64000",
+    "mmap_size=268435456",
+    "foreign_keys=ON",
+    "wal_autocheckpoint=1000",
+    "busy_timeout=30000",
+)
+
+# Size and lifetime in seconds of the user lookup caches. Users rarely
+# change, and entries are dropped as soon as any connection (including
+# other processes') commits a write
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 600
+
+# Rows fetched at a time when streaming a whole table
+FETCH_CHUNK_SIZE = 1000
+
+# Read-only connections kept open for queries. With WAL they read in
+# parallel with each other and with the writer
+READ_POOL_SIZE = 4
+
+
+# Parse an ISO 8601 timestamp, accepting a trailing "Z" for UTC. Event times
+# are parsed repeatedly while formatting, so results are memoized
+@functools.lru_cache(maxsize=4096)
+def parse_timestamp(value: str) -> datetime.datetime:
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    return datetime.datetime.fromisoformat(value)
+
+
+# Convert an ISO 8601 timestamp or date to Unix seconds the way SQLite's
+# strftime('%s') does for the events' start_ts/end_ts, reading naive times
+# as UTC
+def to_epoch(value: str) -> int:
+    return calendar.timegm(parse_timestamp(value).utctimetuple())
+
+
+# Format Unix seconds as a naive ISO 8601 timestamp, the inverse of to_epoch
+def from_epoch(seconds: int) -> str:
+    return (
+        datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc)
+        .replace(tzinfo=None)
+        .isoformat()
+    )
+
+
+# Unix-second versions of the event times, computed by SQLite from the ISO
+# text so every writer (including the API and the seed script) keeps them in
+# sync and range filters compare integers
+EVENT_EPOCH_COLUMNS = {
+    "start_ts": "INTEGER GENERATED ALWAYS AS"
+    " (CAST(strftime('%s', start_time) AS INTEGER)) VIRTUAL",
+    "end_ts": "INTEGER GENERATED ALWAYS AS"
+    " (CAST(strftime('%s', end_time) AS INTEGER)) VIRTUAL",
+}
+
+
+# Trigrams need at least three characters, shorter name searches use LIKE
+FTS_MIN_QUERY_LENGTH = 3
+
+# Statements used by the model. Keeping each text in one place means
+# every call hits the connection's prepared statement cache with the same SQL
+SQL_INSERT_USER = "INSERT INTO users (name, email) VALUES (?, ?)"
+SQL_INSERT_USERS = "INSERT OR IGNORE INTO users (name, email) VALUES (?, ?)"
+SQL_GET_USER_ID_BY_EMAIL = "SELECT id FROM users WHERE email = ?"
+SQL_GET_USER_IDS_BY_EMAILS = """
+    SELECT n.value AS email, u.id
+    FROM json_each(?) n
+    JOIN users u ON u.email = n.value
+"""
+SQL_GET_USER_BY_EMAIL = "SELECT id, name, email FROM users WHERE email = ?"
+SQL_SEARCH_USERS_BY_NAME = "SELECT id, name, email FROM users WHERE name LIKE ?"
+SQL_SEARCH_USERS_BY_NAME_FTS = """
+    SELECT u.id, u.name, u.email
+    FROM users_fts f
+    JOIN users u ON u.id = f.rowid
+    WHERE users_fts MATCH ?
+    ORDER BY u.id
+"""
+SQL_MATCH_USERS_BY_NAMES = """
+    SELECT n.value AS lookup, u.id, u.name, u.email
+    FROM json_each(?) n
+    JOIN users u ON u.name LIKE '%' || n.value || '%'
+    ORDER BY n.key, u.rowid
+"""
+SQL_GET_USERS_PAGE = (
+    "SELECT id, name, email FROM users WHERE id > ? ORDER BY id LIMIT ?"
+)
+SQL_INSERT_MEETING_ROOM = (
+    "INSERT INTO meeting_rooms (name, capacity, is_virtual) VALUES (?, ?, ?)"
+)
+SQL_GET_LAST_MEETING_ROOM_IDS = "SELECT id FROM meeting_rooms ORDER BY id DESC LIMIT ?"
+SQL_GET_MEETING_ROOMS_PAGE = """
+    SELECT id, name, capacity, is_virtual FROM meeting_rooms
+    WHERE id > ? ORDER BY id LIMIT ?
+"""
+SQL_GET_AVAILABLE_MEETING_ROOMS = """
+    SELECT m.id, m.name, m.capacity, m.is_virtual
+    FROM meeting_rooms m
+    WHERE m.capacity >= ?
+    AND (m.is_virtual = 1 OR NOT EXISTS (
+        SELECT 1
+        FROM events e
+        WHERE e.meeting_room_id = m.id
+        AND e.start_ts < ? AND e.end_ts > ?
+    ))
+"""
+SQL_GET_ROOM_EVENTS = """
+    SELECT title, start_time, end_time
+    FROM events
+    WHERE meeting_room_id = ?
+    AND start_ts >= ?
+    AND start_ts < ?
+    ORDER BY start_ts
+"""
+SQL_INSERT_EVENT = """
+    INSERT INTO events (title, description, start_time, end_time, meeting_room_id)
+    VALUES (?, ?, ?, ?, ?)
+"""
+SQL_INSERT_USER_EVENTS = """
+    INSERT INTO user_events (user_id, event_id, is_organizer)
+    VALUES (?, ?, ?)
+"""
+SQL_GET_EVENT = """
+    SELECT e.id, e.title, e.description, e.start_time, e.end_time,
+           e.meeting_room_id, m.name as meeting_room_name
+    FROM events e
+    LEFT JOIN meeting_rooms m ON e.meeting_room_id = m.id
+    WHERE e.id = ?
+"""
+SQL_GET_EVENT_WITH_ATTENDEES = """
+    SELECT e.id, e.title, e.description, e.start_time, e.end_time,
+           e.meeting_room_id, m.name as meeting_room_name,
+           u.id AS attendee_id, u.name AS attendee_name,
+           u.email AS attendee_email, ue.is_organizer
+    FROM events e
+    LEFT JOIN meeting_rooms m ON e.meeting_room_id = m.id
+    LEFT JOIN user_events ue ON ue.event_id = e.id
+    LEFT JOIN users u ON u.id = ue.user_id
+    WHERE e.id = ?
+    ORDER BY ue.is_organizer DESC, ue.user_id
+"""
+SQL_GET_USER_EVENTS = """
+    SELECT e.id, e.title, e.description, e.start_time, e.end_time,
+           e.meeting_room_id, m.name as meeting_room_name
+    FROM events e
+    LEFT JOIN meeting_rooms m ON e.meeting_room_id = m.id
+    JOIN user_events ue ON e.id = ue.event_id
+    WHERE ue.user_id = ?
+"""
+SQL_GET_EVENTS_ATTENDEES = """
+    SELECT ue.event_id, u.id, u.name, u.email, ue.is_organizer
+    FROM json_each(?) j
+    JOIN user_events ue ON ue.event_id = j.value
+    JOIN users u ON u.id = ue.user_id
+    ORDER BY ue.is_organizer DESC, ue.user_id
+"""
+SQL_GET_USER_EVENTS_EPOCH = """
+    SELECT e.start_ts, e.end_ts, e.title
+    FROM events e
+    JOIN user_events ue ON e.id = ue.event_id
+    WHERE ue.user_id = ?
+    AND e.start_ts >= ?
+    AND e.start_ts <= ?
+    ORDER BY e.start_ts
+"""
+SQL_FIND_USER_CONFLICT = """
+    SELECT 1
+    FROM events e
+    JOIN user_events ue ON e.id = ue.event_id
+    WHERE ue.user_id = ?
+    AND e.start_ts < ? AND e.end_ts > ?
+    LIMIT 1
+"""
+SQL_FIND_COMMON_FREE_SLOTS = """
+    WITH RECURSIVE
+    days(day) AS (
+        SELECT :first_day WHERE :first_day <= :last_day
+        UNION ALL
+        SELECT day + 86400 FROM days WHERE day + 86400 <= :last_day
+    ),
+    hours(offset) AS (
+        SELECT :first_hour WHERE :first_hour < :end_hour
+        UNION ALL
+        SELECT offset + 3600 FROM hours WHERE offset + 3600 < :end_hour
+    ),
+    slots(slot_start) AS (
+        SELECT day + offset FROM days, hours
+    )
+    SELECT slot_start, slot_start + :duration AS slot_end
+    FROM slots
+    WHERE slot_start + :duration <= :end
+    AND NOT EXISTS (
+        SELECT 1
+        FROM user_events ue
+        JOIN events e ON e.id = ue.event_id
+        WHERE ue.user_id IN (SELECT value FROM json_each(:user_ids))
+        AND e.start_ts >= :start
+        AND e.end_ts <= :end
+        AND e.start_ts < slot_start + :duration
+        AND e.end_ts > slot_start
+    )
+    ORDER BY slot_start
+"""
+SQL_DELETE_EVENT = "DELETE FROM events WHERE id = ?"
 
 
 # Model component
 class CalendarDatabaseModel:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, read_pool_size: int = READ_POOL_SIZE):
         """Initialize the database connection and create tables if they don't exist."""
-        self.conn = sqlite3.connect(db_path)
-        self.conn.row_factory = sqlite3.Row  # Makes rows accessible by column name
-        self.cursor = self.conn.cursor()
+        # One connection for writes, used by one thread at a time
+        self.conn = self._connect(db_path)
+        self._write_lock = threading.RLock()
+        # User lookups by email and by name as (expires_at, data_version,
+        # result), least recently used first
+        self._user_email_cache = OrderedDict()
+        self._user_name_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
         self.setup_database()
+        # Connection that only reads PRAGMA data_version, under _cache_lock.
+        # It changes whenever another connection commits, so cached lookups
+        # see writes from this model and from other processes alike. An
+        # in-memory database has no other connections
+        self._version_conn = None
+        if db_path != ":memory:":
+            self._version_conn = sqlite3.connect(db_path, check_same_thread=False)
+
+        # Queries check out a reader for the length of the call. An in-memory
+        # database is private to its connection, so it's read through the
+        # writer instead
+        if db_path == ":memory:":
+            read_pool_size = 0
+        self.read_pool_size = max(read_pool_size, 1)
+        self._readers = queue.SimpleQueue()
+        for _ in range(read_pool_size):
+            reader = self._connect(db_path)
+            reader.execute("PRAGMA query_only=ON")
+            self._readers.put(reader)
+        self._reader_count = read_pool_size
+        # Once closed, readers still checked out are closed when returned
+        self._closed = False
+        self._pool_lock = threading.Lock()
+
+    @staticmethod
+    def _connect(db_path: str) -> sqlite3.Connection:
+        """Open a connection with the model's settings."""
+        conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row  # Makes rows accessible by column name
+        for pragma in DB_PRAGMAS:
+            conn.execute(f"PRAGMA {pragma}")
+        return conn
+
+    @contextmanager
+    def _read(self) -> Iterator[sqlite3.Connection]:
+        """Check out a reader connection, waiting for one if all are in use."""
+        if not self._reader_count:
+            with self._write_lock:
+                yield self.conn
+            return
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            with self._pool_lock:
+                if not self._closed:
+                    self._readers.put(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """Run a transaction on the writer, committing on success and rolling
+        back on error."""
+        with self._write_lock, self.conn:
+            yield self.conn
+
+    def _query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        """Run a query on a reader connection and fetch all its rows."""
+        with self._read() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _query_one(self, sql: str, params=()) -> Optional[sqlite3.Row]:
+        """Run a query on a reader connection and fetch its first row."""
+        with self._read() as conn:
+            return conn.execute(sql, params).fetchone()
 
     def setup_database(self):
         """Create necessary tables if they don't exist."""
+        # Set up the schema in one transaction, so it takes a single commit
+        # and a failed migration leaves the database as it was
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            schema_version = self._schema_version()
+            self._create_schema()
+            schema_changed = self._schema_version() != schema_version
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+        # Refresh planner statistics when tables or indexes were just created
+        # or rebuilt, so the new indexes get used
+        if schema_changed:
+            self.conn.execute("ANALYZE")
+
+    def _schema_version(self) -> int:
+        """Get the schema version, which SQLite bumps on every schema change."""
+        return self.conn.execute("PRAGMA schema_version").fetchone()[0]
+
+    def _create_schema(self):
+        """Create or migrate the tables, indexes and triggers."""
         # Users table
-        self.cursor.execute(
+        self.conn.execute(
             """
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -30,7 +347,7 @@ class CalendarDatabaseModel:
         )
 
         # Meeting rooms table
-        self.cursor.execute(
+        self.conn.execute(
             """
         CREATE TABLE IF NOT EXISTS meeting_rooms (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -42,7 +359,7 @@ class CalendarDatabaseModel:
         )
 
         # Events table (with optional meeting_room_id)
-        self.cursor.execute(
+        self.conn.execute(
             """
         CREATE TABLE IF NOT EXISTS events (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -56,116 +373,253 @@ class CalendarDatabaseModel:
         """
         )
 
-        # User-Event junction table (for many-to-many relationship)
-        self.cursor.execute(
-            """
-        CREATE TABLE IF NOT EXISTS user_events (
+        # Add the epoch columns to events tables created before they existed
+        event_columns = {
+            row["name"] for row in self.conn.execute("PRAGMA table_xinfo(events)")
+        }
+        for column, definition in EVENT_EPOCH_COLUMNS.items():
+            if column not in event_columns:
+                self.conn.execute(
+                    f"ALTER TABLE events ADD COLUMN {column} {definition}"
+                )
+
+        # User-Event junction table (for many-to-many relationship). The
+        # primary key is the whole row identity, so it's stored WITHOUT ROWID
+        # and attendee joins walk the primary key B-tree directly
+        user_events_schema = """
+        CREATE TABLE IF NOT EXISTS {table} (
             user_id INTEGER NOT NULL,
             event_id INTEGER NOT NULL,
             is_organizer BOOLEAN NOT NULL DEFAULT 0,
             PRIMARY KEY (user_id, event_id),
             FOREIGN KEY (user_id) REFERENCES users (id),
             FOREIGN KEY (event_id) REFERENCES events (id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        """
+        existing = self.conn.execute("PRAGMA table_list(user_events)").fetchone()
+        if existing is not None and not existing["wr"]:
+            # Rebuild a junction table created with a rowid, leaving out rows
+            # whose user or event no longer exists
+            self.conn.execute(user_events_schema.format(table="user_events_new"))
+            self.conn.execute(
+                """
+            INSERT OR IGNORE INTO user_events_new (user_id, event_id, is_organizer)
+            SELECT ue.user_id, ue.event_id, ue.is_organizer
+            FROM user_events ue
+            WHERE EXISTS (SELECT 1 FROM users u WHERE u.id = ue.user_id)
+            AND EXISTS (SELECT 1 FROM events e WHERE e.id = ue.event_id)
+            """
+            )
+            self.conn.execute("DROP TABLE user_events")
+            self.conn.execute("ALTER TABLE user_events_new RENAME TO user_events")
+        else:
+            self.conn.execute(user_events_schema.format(table="user_events"))
+
+        # Indexes for a room's and everyone's events by start time. The room
+        # index only holds events booked in a room
+        self.conn.execute(
+            """
+        CREATE INDEX IF NOT EXISTS idx_events_room_ts
+        ON events (meeting_room_id, start_ts, end_ts)
+        WHERE meeting_room_id IS NOT NULL
+        """
         )
+        self.conn.execute(
+            """
+        CREATE INDEX IF NOT EXISTS idx_events_ts
+        ON events (start_ts, end_ts)
         """
         )
 
+        # Attendee index, name search index and the one-off orphan purge,
+        # shared with the API
+        apply_shared_schema(self.conn)
+
         # Insert a virtual meeting room if it doesn't exist
-        self.cursor.execute(
+        self.conn.execute(
             """
         INSERT OR IGNORE INTO meeting_rooms (id, name, capacity, is_virtual)
         VALUES (1, 'Online Meeting', 999, 1)
         """
         )
 
-        self.conn.commit()
-
     # User operations
     def add_user(self, name: str, email: str) -> int:
         """Add a new user to the database."""
         try:
-            self.cursor.execute(
-                "INSERT INTO users (name, email) VALUES (?, ?)", (name, email)
-            )
-            self.conn.commit()
-            return self.cursor.lastrowid
+            with self._write() as conn:
+                cursor = conn.execute(SQL_INSERT_USER, (name, email))
+            # The new user may match any cached name lookup
+            with self._cache_lock:
+                self._user_email_cache.pop(email, None)
+                self._user_name_cache.clear()
+            return cursor.lastrowid
         except sqlite3.IntegrityError:
             # If user with email already exists, return their ID
-            self.cursor.execute("SELECT id FROM users WHERE email = ?", (email,))
-            return self.cursor.fetchone()[0]
+            return self._query_one(SQL_GET_USER_ID_BY_EMAIL, (email,))[0]
 
-    def get_user_by_email(self, email: str) -> Optional[Dict]:
-        """Get user details by email."""
-        self.cursor.execute(
-            "SELECT id, name, email FROM users WHERE email = ?", (email,)
+    def add_users(self, users: List[Tuple[str, str]]) -> List[int]:
+        """Add several (name, email) users in one transaction.
+
+        Returns the user IDs in the same order, existing users keeping theirs.
+        """
+        with self._write() as conn:
+            conn.executemany(SQL_INSERT_USERS, users)
+        with self._cache_lock:
+            self._user_email_cache.clear()
+            self._user_name_cache.clear()
+
+        rows = self._query(
+            SQL_GET_USER_IDS_BY_EMAILS,
+            (json.dumps([email for _, email in users]),),
         )
-        row = self.cursor.fetchone()
-        if row:
-            return dict(row)
-        return None
+        ids = dict(rows)
+        return [ids[email] for _, email in users]
 
-    def get_user_by_name(self, name: str) -> List[Dict]:
+    def get_user_by_email(self, email: str) -> Optional[Dict]:
+        """Get user details by email."""
+        found, user, version = self._get_cached(self._user_email_cache, email)
+        if not found:
+            row = self._query_one(SQL_GET_USER_BY_EMAIL, (email,))
+            user = dict(row) if row else None
+            self._store_cached(self._user_email_cache, email, version, user)
+        return dict(user) if user else None
+
+    def get_user_by_name(self, name: str) -> List[sqlite3.Row]:
         """Get user details by name (might return multiple users)."""
-        self.cursor.execute(
-            "SELECT id, name, email FROM users WHERE name LIKE ?", (f"%{name}%",)
+        found, users, version = self._get_cached(self._user_name_cache, name)
+        if not found:
+            if len(name) >= FTS_MIN_QUERY_LENGTH:
+                # Quote the name so it is matched as a literal substring
+                phrase = '"' + name.replace('"', '""') + '"'
+                users = self._query(SQL_SEARCH_USERS_BY_NAME_FTS, (phrase,))
+            else:
+                users = self._query(SQL_SEARCH_USERS_BY_NAME, (f"%{name}%",))
+            self._store_cached(self._user_name_cache, name, version, users)
+        # Rows are read-only, only the list needs copying
+        return list(users)
+
+    def _get_cached(self, cache: OrderedDict, key: str) -> Tuple[bool, object, int]:
+        """Get (found, result, data_version) for a cached lookup, marking it
+        as recently used.
+
+        Entries that expired or predate the current data version are not
+        found. The version is returned for storing a fresh result, since it
+        was read before the caller's query.
+        """
+        with self._cache_lock:
+            version = (
+                self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+                if self._version_conn
+                else 0
+            )
+            entry = cache.get(key)
+            if entry is None:
+                return False, None, version
+            if entry[0] < time.monotonic() or entry[1] != version:
+                del cache[key]
+                return False, None, version
+            cache.move_to_end(key)
+            return True, entry[2], version
+
+    def _store_cached(self, cache: OrderedDict, key: str, version: int, result: object):
+        """Cache a lookup, evicting the least recently used one if full."""
+        with self._cache_lock:
+            cache[key] = (time.monotonic() + USER_CACHE_TTL, version, result)
+            cache.move_to_end(key)
+            if len(cache) > USER_CACHE_SIZE:
+                cache.popitem(last=False)
+
+    def get_users_by_names(self, names: List[str]) -> Dict[str, Dict]:
+        """Get the first user partially matching each name, keyed by the name
+        as given. Names without a match are left out."""
+        rows = self._query(
+            SQL_MATCH_USERS_BY_NAMES,
+            (json.dumps([str(name) for name in names]),),
         )
-        rows = self.cursor.fetchall()
-        return [dict(row) for row in rows]
 
-    def get_all_users(self) -> List[Dict]:
+        users = {}
+        for row in rows:
+            user = dict(row)
+            users.setdefault(user.pop("lookup"), user)
+        return users
+
+    def iter_all_users(self) -> Iterator[sqlite3.Row]:
+        """Yield all users, fetching FETCH_CHUNK_SIZE rows at a time."""
+        return self._iter_rows(SQL_GET_USERS_PAGE)
+
+    def get_all_users(self) -> List[sqlite3.Row]:
         """Get all users."""
-        self.cursor.execute("SELECT id, name, email FROM users")
-        rows = self.cursor.fetchall()
-        return [dict(row) for row in rows]
+        return list(self.iter_all_users())
 
     # Meeting room operations
     def add_meeting_room(
         self, name: str, capacity: int, is_virtual: bool = False
     ) -> int:
         """Add a new meeting room."""
-        self.cursor.execute(
-            "INSERT INTO meeting_rooms (name, capacity, is_virtual) VALUES (?, ?, ?)",
-            (name, capacity, is_virtual),
-        )
-        self.conn.commit()
-        return self.cursor.lastrowid
+        with self._write() as conn:
+            cursor = conn.execute(
+                SQL_INSERT_MEETING_ROOM,
+                (name, capacity, is_virtual),
+            )
+        return cursor.lastrowid
+
+    def add_meeting_rooms(self, rooms: List[Tuple[str, int, bool]]) -> List[int]:
+        """Add several (name, capacity, is_virtual) rooms in one transaction.
 
-    def get_all_meeting_rooms(self) -> List[Dict]:
+        Returns the new room IDs in the same order.
+        """
+        if not rooms:
+            return []
+        with self._write() as conn:
+            conn.executemany(SQL_INSERT_MEETING_ROOM, rooms)
+            # The write lock is held until commit, so the highest IDs are ours
+            cursor = conn.execute(SQL_GET_LAST_MEETING_ROOM_IDS, (len(rooms),))
+            ids = [row[0] for row in cursor.fetchall()]
+        return ids[::-1]
+
+    def iter_all_meeting_rooms(self) -> Iterator[sqlite3.Row]:
+        """Yield all meeting rooms, fetching FETCH_CHUNK_SIZE rows at a time."""
+        return self._iter_rows(SQL_GET_MEETING_ROOMS_PAGE)
+
+    def get_all_meeting_rooms(self) -> List[sqlite3.Row]:
         """Get all meeting rooms."""
-        self.cursor.execute("SELECT id, name, capacity, is_virtual FROM meeting_rooms")
-        rows = self.cursor.fetchall()
-        return [dict(row) for row in rows]
+        return list(self.iter_all_meeting_rooms())
+
+    def _iter_rows(self, sql: str) -> Iterator[sqlite3.Row]:
+        """Stream a table's rows in id order, FETCH_CHUNK_SIZE at a time.
+
+        sql takes the last id seen and the page size. Each page is read on
+        its own reader checkout, so no connection stays checked out while
+        the caller works through the rows or if it stops early.
+        """
+        last_id = 0
+        while True:
+            chunk = self._query(sql, (last_id, FETCH_CHUNK_SIZE))
+            yield from chunk
+            if len(chunk) < FETCH_CHUNK_SIZE:
+                return
+            last_id = chunk[-1]["id"]
 
     def get_available_meeting_rooms(
         self, start_time: str, end_time: str, min_capacity: int = 1
     ) -> List[Dict]:
         """Get meeting rooms available during the specified time period."""
-        self.cursor.execute(
-            """
-        SELECT m.id, m.name, m.capacity, m.is_virtual
-        FROM meeting_rooms m
-        WHERE m.capacity >= ?
-        AND (m.is_virtual = 1 OR m.id NOT IN (
-            SELECT DISTINCT meeting_room_id
-            FROM events
-            WHERE meeting_room_id IS NOT NULL
-            AND ((start_time <= ? AND end_time > ?) OR
-                 (start_time < ? AND end_time >= ?) OR
-                 (start_time >= ? AND end_time <= ?))
-        ))
-        """,
-            (
-                min_capacity,
-                end_time,
-                start_time,
-                end_time,
-                start_time,
-                start_time,
-                end_time,
-            ),
+        rows = self._query(
+            SQL_GET_AVAILABLE_MEETING_ROOMS,
+            (min_capacity, to_epoch(end_time), to_epoch(start_time)),
         )
+        return [dict(row) for row in rows]
 
-        rows = self.cursor.fetchall()
+    def get_room_events(
+        self, room_id: int, start_time: str, end_time: str
+    ) -> List[Dict]:
+        """Get events booked in a meeting room that start at or after start_time
+        and before end_time."""
+        rows = self._query(
+            SQL_GET_ROOM_EVENTS,
+            (room_id, to_epoch(start_time), to_epoch(end_time)),
+        )
         return [dict(row) for row in rows]
 
     # Event operations
@@ -180,69 +634,57 @@ class CalendarDatabaseModel:
         meeting_room_id: Optional[int] = None,
     ) -> int:
         """Create a new event with organizer and attendees."""
-        try:
+        # The event and its attendees commit together, or roll back on error
+        with self._write() as conn:
             # Insert the event
-            self.cursor.execute(
-                "INSERT INTO events (title, description, start_time, end_time, meeting_room_id) VALUES (?, ?, ?, ?, ?)",
+            cursor = conn.execute(
+                SQL_INSERT_EVENT,
                 (title, description, start_time, end_time, meeting_room_id),
             )
-            event_id = self.cursor.lastrowid
-
-            # Add organizer
-            self.cursor.execute(
-                "INSERT INTO user_events (user_id, event_id, is_organizer) VALUES (?, ?, 1)",
-                (organizer_id, event_id),
-            )
+            event_id = cursor.lastrowid
 
-            # Add attendees
+            # Add organizer and attendees in one batch, one row per user. An
+            # organizer also listed as an attendee keeps the organizer flag,
+            # while a missing organizer still fails the NOT NULL constraint
+            people = {organizer_id: 1}
             for user_id in attendee_ids:
-                if (
-                    user_id != organizer_id
-                ):  # Avoid duplicate if organizer is also in attendees
-                    self.cursor.execute(
-                        "INSERT INTO user_events (user_id, event_id, is_organizer) VALUES (?, ?, 0)",
-                        (user_id, event_id),
-                    )
-
-            self.conn.commit()
-            return event_id
-        except sqlite3.Error as e:
-            self.conn.rollback()
-            raise e
+                people.setdefault(user_id, 0)
+            conn.executemany(
+                SQL_INSERT_USER_EVENTS,
+                [(user_id, event_id, flag) for user_id, flag in people.items()],
+            )
 
-    def get_event_by_id(self, event_id: int) -> Optional[Dict]:
-        """Get event details by ID, including attendees."""
-        self.cursor.execute(
-            """
-        SELECT e.id, e.title, e.description, e.start_time, e.end_time, 
-               e.meeting_room_id, m.name as meeting_room_name
-        FROM events e
-        LEFT JOIN meeting_rooms m ON e.meeting_room_id = m.id
-        WHERE e.id = ?
-        """,
-            (event_id,),
-        )
+        return event_id
 
-        event_row = self.cursor.fetchone()
-        if not event_row:
-            return None
+    def get_event_by_id(
+        self, event_id: int, include_attendees: bool = True
+    ) -> Optional[Dict]:
+        """Get event details by ID, including attendees.
 
-        event = dict(event_row)
-
-        # Get attendees
-        self.cursor.execute(
-            """
-        SELECT u.id, u.name, u.email, ue.is_organizer
-        FROM users u
-        JOIN user_events ue ON u.id = ue.user_id
-        WHERE ue.event_id = ?
-        """,
-            (event_id,),
-        )
+        Pass include_attendees=False to load the event row alone.
+        """
+        if not include_attendees:
+            row = self._query_one(SQL_GET_EVENT, (event_id,))
+            return dict(row) if row else None
 
-        attendee_rows = self.cursor.fetchall()
-        event["attendees"] = [dict(row) for row in attendee_rows]
+        # One row per attendee, or a single row with NULL attendee columns
+        rows = self._query(SQL_GET_EVENT_WITH_ATTENDEES, (event_id,))
+        if not rows:
+            return None
 
+        event = dict(rows[0])
+        for key in ("attendee_id", "attendee_name", "attendee_email", "is_organizer"):
+            del event[key]
+        event["attendees"] = [
+            {
+                "id": row["attendee_id"],
+                "name": row["attendee_name"],
+                "email": row["attendee_email"],
+                "is_organizer": row["is_organizer"],
+            }
+            for row in rows
+            if row["attendee_id"] is not None
+        ]
         return event
 
     def get_user_events(
@@ -250,74 +692,78 @@ class CalendarDatabaseModel:
         user_id: int,
         start_date: Optional[str] = None,
         end_date: Optional[str] = None,
+        include_attendees: bool = True,
     ) -> List[Dict]:
-        """Get events for a specific user in a date range."""
-        query = """
-        SELECT e.id, e.title, e.description, e.start_time, e.end_time, 
-               e.meeting_room_id, m.name as meeting_room_name
-        FROM events e
-        LEFT JOIN meeting_rooms m ON e.meeting_room_id = m.id
-        JOIN user_events ue ON e.id = ue.event_id
-        WHERE ue.user_id = ?
+        """Get events for a specific user in a date range.
+
+        Pass include_attendees=False to skip loading each event's attendees.
         """
+        query = SQL_GET_USER_EVENTS
 
         params = [user_id]
 
         if start_date:
-            query += " AND e.start_time >= ?"
-            params.append(start_date)
+            query += " AND e.start_ts >= ?"
+            params.append(to_epoch(start_date))
 
         if end_date:
-            query += " AND e.start_time <= ?"
-            params.append(end_date)
+            query += " AND e.start_ts <= ?"
+            params.append(to_epoch(end_date))
 
-        query += " ORDER BY e.start_time"
+        query += " ORDER BY e.start_ts"
 
-        self.cursor.execute(query, params)
-        rows = self.cursor.fetchall()
+        rows = self._query(query, params)
 
-        events = []
-        for row in rows:
-            event = dict(row)
-            event_id = event["id"]
+        events = [dict(row) for row in rows]
+        if not include_attendees or not events:
+            return events
 
-            # Get attendees for each event
-            self.cursor.execute(
-                """
-            SELECT u.id, u.name, u.email, ue.is_organizer
-            FROM users u
-            JOIN user_events ue ON u.id = ue.user_id
-            WHERE ue.event_id = ?
-            """,
-                (event_id,),
-            )
+        # Get the attendees of all the events in one query, passing the ids
+        # as a JSON array to stay clear of the bound parameter limit
+        rows = self._query(
+            SQL_GET_EVENTS_ATTENDEES,
+            (json.dumps([event["id"] for event in events]),),
+        )
 
-            attendee_rows = self.cursor.fetchall()
-            event["attendees"] = [dict(row) for row in attendee_rows]
+        attendees = {event["id"]: [] for event in events}
+        for event_id, user_id, name, email, is_organizer in rows:
+            attendees[event_id].append(
+                {
+                    "id": user_id,
+                    "name": name,
+                    "email": email,
+                    "is_organizer": is_organizer,
+                }
+            )
 
-            events.append(event)
+        for event in events:
+            event["attendees"] = attendees[event["id"]]
 
         return events
 
+    def get_user_events_epoch(
+        self, user_id: int, start_date: str, end_date: str
+    ) -> List[Tuple[int, int, str]]:
+        """Get (start, end, title) for a user's events in a date range, ordered
+        by start, with the times as Unix seconds (naive times read as UTC)."""
+        rows = self._query(
+            SQL_GET_USER_EVENTS_EPOCH,
+            (user_id, to_epoch(start_date), to_epoch(end_date)),
+        )
+
+        return [tuple(row) for row in rows]
+
     def check_user_availability(
         self, user_id: int, start_time: str, end_time: str
     ) -> bool:
         """Check if a user is available during the specified time period."""
-        self.cursor.execute(
-            """
-        SELECT COUNT(*) as count
-        FROM events e
-        JOIN user_events ue ON e.id = ue.event_id
-        WHERE ue.user_id = ?
-        AND ((e.start_time <= ? AND e.end_time > ?) OR
-             (e.start_time < ? AND e.end_time >= ?) OR
-             (e.start_time >= ? AND e.end_time <= ?))
-        """,
-            (user_id, end_time, start_time, end_time, start_time, start_time, end_time),
+        conflict = self._query_one(
+            SQL_FIND_USER_CONFLICT,
+            (user_id, to_epoch(end_time), to_epoch(start_time)),
         )
 
-        result = self.cursor.fetchone()
-        return result["count"] == 0
+        # Available unless at least one overlapping event exists
+        return conflict is None
 
     def find_common_available_time(
         self,
@@ -329,90 +775,52 @@ class CalendarDatabaseModel:
         end_hour: int = 17,
     ) -> List[Dict]:
         """Find common available time slots for multiple users."""
-        # Get all events for these users in the date range
-        events_by_user = {}
-        for user_id in user_ids:
-            self.cursor.execute(
-                """
-            SELECT e.start_time, e.end_time
-            FROM events e
-            JOIN user_events ue ON e.id = ue.event_id
-            WHERE ue.user_id = ?
-            AND e.start_time >= ?
-            AND e.end_time <= ?
-            ORDER BY e.start_time
-            """,
-                (user_id, start_date, end_date),
-            )
-
-            events_by_user[user_id] = self.cursor.fetchall()
-
-        # Convert start_date and end_date strings to datetime objects
-        start_datetime = datetime.datetime.fromisoformat(
-            start_date.replace("Z", "+00:00")
+        start_epoch = to_epoch(start_date)
+        end_epoch = to_epoch(end_date)
+
+        # Hourly slots within the working hours of each day, keeping those
+        # that end within the range and don't overlap anyone's events. A
+        # meeting starting right as a slot ends doesn't block it
+        rows = self._query(
+            SQL_FIND_COMMON_FREE_SLOTS,
+            {
+                "first_day": start_epoch - start_epoch % 86400,
+                "last_day": end_epoch - end_epoch % 86400,
+                "first_hour": start_hour * 3600,
+                "end_hour": end_hour * 3600,
+                "duration": duration_minutes * 60,
+                "start": start_epoch,
+                "end": end_epoch,
+                "user_ids": json.dumps(user_ids),
+            },
         )
-        end_datetime = datetime.datetime.fromisoformat(end_date.replace("Z", "+00:00"))
-
-        # Generate potential time slots
-        available_slots = []
-        current_date = start_datetime.date()
 
-        while current_date <= end_datetime.date():
-            for hour in range(start_hour, end_hour):
-                slot_start = datetime.datetime.combine(
-                    current_date, datetime.time(hour, 0)
-                )
-
-                slot_end = slot_start + datetime.timedelta(minutes=duration_minutes)
-
-                # Skip if the slot extends beyond our search range
-                if slot_end > end_datetime:
-                    continue
-
-                # Check if all users are available for this slot
-                all_available = True
-
-                for user_id, user_events in events_by_user.items():
-                    for event in user_events:
-                        event_start = datetime.datetime.fromisoformat(
-                            event[0].replace("Z", "+00:00")
-                        )
-                        event_end = datetime.datetime.fromisoformat(
-                            event[1].replace("Z", "+00:00")
-                        )
-
-                        # Check if there's an overlap
-                        if event_start <= slot_end and event_end > slot_start:
-                            all_available = False
-                            break
-
-                    if not all_available:
-                        break
-
-                if all_available:
-                    available_slots.append(
-                        {
-                            "start_time": slot_start.isoformat(),
-                            "end_time": slot_end.isoformat(),
-                        }
-                    )
-
-            current_date += datetime.timedelta(days=1)
-
-        return available_slots
+        return [
+            {"start_time": from_epoch(slot_start), "end_time": from_epoch(slot_end)}
+            for slot_start, slot_end in rows
+        ]
 
     def cancel_event(self, event_id: int) -> bool:
         """Cancel (delete) an event."""
         try:
-            self.cursor.execute("DELETE FROM events WHERE id = ?", (event_id,))
-            rows_affected = self.cursor.rowcount
-            self.conn.commit()
-            return rows_affected > 0
+            with self._write() as conn:
+                cursor = conn.execute(SQL_DELETE_EVENT, (event_id,))
+            return cursor.rowcount > 0
         except sqlite3.Error:
-            self.conn.rollback()
             return False
 
     def close(self):
-        """Close the database connection."""
+        """Close the database connections."""
+        with self._pool_lock:
+            self._closed = True
+        # Readers in use are closed by _read when they are handed back
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        self._reader_count = 0
+        if self._version_conn:
+            self._version_conn.close()
         if self.conn:
             self.conn.close()
@@ -0,0 +1,77 @@
+"""Schema objects shared by the API (app.py) and the chatbot's model.
+
+Both open the same database file and whichever runs first creates these, so
+they are defined once here instead of in each module.
+"""
+
+# Version of the shared schema, kept in PRAGMA user_version. Databases below
+# it still get the one-off migration steps in apply_shared_schema
+SHARED_SCHEMA_VERSION = 1
+
+# Index for an event's attendees, organizers first. The (user_id, event_id)
+# primary key already covers lookups by user
+SQL_CREATE_USER_EVENTS_EVENT_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_user_events_event
+    ON user_events (event_id, is_organizer, user_id)
+"""
+
+# Trigram index over users.name for substring search, kept in sync by
+# triggers and filled from the existing users when first created
+USERS_FTS_SCHEMA = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        name, content='users', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts (rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts (users_fts, rowid, name)
+        VALUES ('delete', old.id, old.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF name ON users BEGIN
+        INSERT INTO users_fts (users_fts, rowid, name)
+        VALUES ('delete', old.id, old.name);
+        INSERT INTO users_fts (rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+)
+SQL_USERS_FTS_EXISTS = (
+    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'"
+)
+SQL_REBUILD_USERS_FTS = "INSERT INTO users_fts (users_fts) VALUES ('rebuild')"
+
+# Attendee rows left behind by events or users deleted before foreign keys were
+# enforced (or by scripts that disable them), which would otherwise show up on
+# events reusing their ids
+SQL_DELETE_ORPHAN_USER_EVENTS = """
+    DELETE FROM user_events
+    WHERE event_id NOT IN (SELECT id FROM events)
+    OR user_id NOT IN (SELECT id FROM users)
+"""
+
+
+def apply_shared_schema(conn):
+    """Create the shared indexes and triggers and run pending migrations.
+
+    Runs inside the caller's transaction, on a database that already has the
+    users, events and user_events tables.
+    """
+    conn.execute(SQL_CREATE_USER_EVENTS_EVENT_INDEX)
+
+    fts_exists = conn.execute(SQL_USERS_FTS_EXISTS).fetchone()
+    for statement in USERS_FTS_SCHEMA:
+        conn.execute(statement)
+    if not fts_exists:
+        conn.execute(SQL_REBUILD_USERS_FTS)
+
+    # Foreign keys are enforced from here on, so orphans are purged once
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SHARED_SCHEMA_VERSION:
+        conn.execute(SQL_DELETE_ORPHAN_USER_EVENTS)
+        conn.execute(f"PRAGMA user_version = {SHARED_SCHEMA_VERSION}")
@@ -1,10 +1,4 @@
-import datetime
-import json
 import os
-import sqlite3
-from typing import Any, Dict, List, Optional, Set, Tuple
-
-import requests
 
 from calendar_chatbot_presenter import CalendarChatbotPresenter
 from calendar_controller import CalendarController
@@ -16,10 +10,14 @@ def main():
     db_path = "calendar_database.db"
     ollama_url = os.environ.get("OLLAMA_URL", "http://localhost:11434")
     model_name = os.environ.get("OLLAMA_MODEL", "llama3")
+    # Match the number of requests the Ollama server handles in parallel
+    max_parallel = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
 
     # Initialize components
     db_model = CalendarDatabaseModel(db_path)
-    controller = CalendarController(db_model, ollama_url, model_name)
+    controller = CalendarController(
+        db_model, ollama_url, model_name, max_parallel, preload_model=True
+    )
     presenter = CalendarChatbotPresenter(controller)
 
     try:
@@ -0,0 +1,6 @@
+# WSGI entry point for running the API under gunicorn:
+#   gunicorn -w 4 --threads 8 -k gthread wsgi:application
+# Each worker thread keeps its own SQLite connection (see get_db_connection)
+from app import app
+
+application = app